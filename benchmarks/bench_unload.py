@@ -0,0 +1,112 @@
+import argparse
+import collections
+import gzip
+import itertools
+import os
+import random
+import string
+import tempfile
+import time
+import urllib.parse
+
+from typing import Dict, List
+from unittest import mock
+
+import boto3
+from moto import mock_s3
+
+from redshift_unloader import Metrics, RedshiftUnloader, StageMetric
+
+MB = 1024 * 1024
+
+BUCKET = 'redshift-unloader-benchmark'
+REGION = 'us-east-1'
+THROUGHPUT_STAGES = ('download', 'merge')
+
+
+def generate_slice(seed: int, slice_size: int) -> bytes:
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    for i in itertools.count():
+        line = f'"{i}","{"".join(rng.choices(string.ascii_letters, k=16))}","{rng.random()}"\n'
+        lines.append(line)
+        size += len(line)
+        if size >= slice_size:
+            break
+    return gzip.compress(''.join(lines).encode(), compresslevel=1)
+
+
+class FakeRedshift:
+    bodies: List[bytes] = []
+
+    def __init__(self, host, port, user, password, database, credential) -> None:
+        self.__client = boto3.client('s3', region_name=REGION)
+
+    def get_columns(self, query: str, add_quotes: bool = True) -> List[str]:
+        return ['"id"', '"name"', '"value"']
+
+    def get_range(self, query: str, column: str):
+        return 0, len(self.bodies) * 1000
+
+    def unload(self, query: str, s3_uri: str, **options) -> bool:
+        uri = urllib.parse.urlparse(s3_uri)
+        prefix = uri.path.lstrip('/')
+        for i, body in enumerate(self.bodies):
+            self.__client.put_object(Bucket=uri.netloc, Key=f'{prefix}{i:04d}_part_00.gz', Body=body)
+        return True
+
+
+def run(slices: int, slice_size: int, concurrency: int, part_size: int, part_concurrency: int) -> None:
+    FakeRedshift.bodies = [generate_slice(i, slice_size) for i in range(slices)]
+    records: List[StageMetric] = []
+
+    with mock_s3(), mock.patch('redshift_unloader.redshift_unloader.Redshift', FakeRedshift), \
+            tempfile.TemporaryDirectory() as temp_dir:
+        boto3.client('s3', region_name=REGION).create_bucket(Bucket=BUCKET)
+
+        unloader = RedshiftUnloader(host='localhost', port=5439, user='user', password='password',
+                                    database='database', s3_bucket=BUCKET, access_key_id='access_key_id',
+                                    secret_access_key='secret_access_key', region=REGION,
+                                    concurrency=concurrency, part_size=part_size, part_concurrency=part_concurrency,
+                                    metrics=Metrics(records.append))
+        filename = os.path.join(temp_dir, 'result.csv.gz')
+
+        start = time.perf_counter()
+        unloader.unload('SELECT * FROM benchmark', filename)
+        total = time.perf_counter() - start
+        output_size = os.path.getsize(filename)
+
+    stages: Dict[str, List[StageMetric]] = collections.OrderedDict()
+    for record in records:
+        stages.setdefault(record.stage, []).append(record)
+
+    print(f'slices={slices} slice_size={slice_size // 1024}KB concurrency={concurrency} '
+          f'part_size={part_size // 1024}KB part_concurrency={part_concurrency}')
+    for stage, metrics in stages.items():
+        seconds = sum(metric.duration for metric in metrics)
+        size = sum(metric.bytes for metric in metrics)
+        throughput = f'{size / MB / seconds:10.2f} MB/s' if stage in THROUGHPUT_STAGES and seconds else ''
+        print(f'  {stage:<12} {sum(metric.objects for metric in metrics):>6} object(s) {seconds:10.4f} s '
+              f'{sum(metric.retries for metric in metrics):>3} retries {throughput}')
+    print(f'  {"total":<12} {"":>16} {total:10.4f} s {"":>11} {output_size / MB / total:10.2f} MB/s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark RedshiftUnloader.unload against in-process S3')
+    parser.add_argument('--slices', type=int, nargs='+', default=[4, 32])
+    parser.add_argument('--slice-size', type=int, nargs='+', default=[MB], help='uncompressed bytes per slice')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--part-size', type=int, default=8 * MB)
+    parser.add_argument('--part-concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'access_key_id')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'secret_access_key')
+
+    for slices, slice_size, concurrency in itertools.product(args.slices, args.slice_size, args.concurrency):
+        run(slices, slice_size, concurrency, args.part_size, args.part_concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,10 @@
+from redshift_unloader.async_redshift_unloader import AsyncRedshiftUnloader
+from redshift_unloader.cache import ResultCache
+from redshift_unloader.job import UnloadJob, UnloadResult
+from redshift_unloader.metrics import Metrics, StageMetric
+from redshift_unloader.partition import PartitionFile
 from redshift_unloader.redshift_unloader import RedshiftUnloader
+from redshift_unloader.watermark import FileWatermarkStore, Watermark, WatermarkStore
 
 
 __version__ = '0.1.4'
@@ -0,0 +1,101 @@
+import asyncio
+import concurrent.futures
+import functools
+
+from typing import Any, BinaryIO, Callable, Iterable, List, Optional, TypeVar
+
+from redshift_unloader.cache import ResultCache
+from redshift_unloader.compression import GZIP
+from redshift_unloader.credential import Credential
+from redshift_unloader.job import UnloadJob, UnloadResult
+from redshift_unloader.metrics import Metrics
+from redshift_unloader.partition import PartitionFile
+from redshift_unloader.redshift_unloader import (RedshiftUnloader, DEFAULT_COLUMN_CACHE_SIZE, DEFAULT_CONCURRENCY,
+                                                DEFAULT_ORPHAN_AGE)
+from redshift_unloader.s3 import S3, DEFAULT_PART_SIZE, DEFAULT_PART_CONCURRENCY
+
+T = TypeVar('T')
+
+
+class AsyncRedshiftUnloader:
+    __unloader: RedshiftUnloader
+    __s3: S3
+    __executor: concurrent.futures.ThreadPoolExecutor
+
+    def __init__(self, host: str, port: int, user: str, password: str,
+                 database: str, s3_bucket: str, access_key_id: str,
+                 secret_access_key: str, region: str, verbose: bool = False,
+                 concurrency: int = DEFAULT_CONCURRENCY, max_in_flight: Optional[int] = None,
+                 part_size: int = DEFAULT_PART_SIZE, part_concurrency: int = DEFAULT_PART_CONCURRENCY,
+                 pool_size: int = 1, cache: Optional[ResultCache] = None,
+                 metrics: Optional[Metrics] = None, column_cache_size: int = DEFAULT_COLUMN_CACHE_SIZE,
+                 auto_file_size: bool = False, sweep_orphans: bool = False,
+                 orphan_age: float = DEFAULT_ORPHAN_AGE, max_workers: Optional[int] = None) -> None:
+        self.__unloader = RedshiftUnloader(host=host, port=port, user=user, password=password,
+                                           database=database, s3_bucket=s3_bucket, access_key_id=access_key_id,
+                                           secret_access_key=secret_access_key, region=region, verbose=verbose,
+                                           concurrency=concurrency, max_in_flight=max_in_flight,
+                                           part_size=part_size, part_concurrency=part_concurrency,
+                                           pool_size=pool_size, cache=cache, metrics=metrics,
+                                           column_cache_size=column_cache_size, auto_file_size=auto_file_size,
+                                           sweep_orphans=sweep_orphans, orphan_age=orphan_age)
+        self.__s3 = S3(credential=Credential(access_key_id=access_key_id, secret_access_key=secret_access_key),
+                       bucket=s3_bucket, region=region, max_pool_connections=concurrency * part_concurrency,
+                       part_size=part_size, part_concurrency=part_concurrency)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers if max_workers is not None else 2 * pool_size + concurrency)
+
+    async def __aenter__(self) -> 'AsyncRedshiftUnloader':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+    async def unload(self, query: str, filename: str,
+                     delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                     null_string: str = '', with_header: bool = True, manifest: bool = False,
+                     resume: bool = False, codec: str = GZIP) -> None:
+        await self.__run(self.__unloader.unload, query, filename, delimiter=delimiter, add_quotes=add_quotes,
+                         escape=escape, null_string=null_string, with_header=with_header, manifest=manifest,
+                         resume=resume, codec=codec)
+
+    async def unload_fileobj(self, query: str, fileobj: BinaryIO,
+                             delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                             null_string: str = '', with_header: bool = True, manifest: bool = False,
+                             codec: str = GZIP) -> None:
+        await self.__run(self.__unloader.unload_fileobj, query, fileobj, delimiter=delimiter, add_quotes=add_quotes,
+                         escape=escape, null_string=null_string, with_header=with_header, manifest=manifest,
+                         codec=codec)
+
+    async def unload_partitioned(self, query: str, directory: str, files: int = 1,
+                                 partition_by: Optional[List[str]] = None,
+                                 delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                                 null_string: str = '', with_header: bool = True) -> List[PartitionFile]:
+        return await self.__run(self.__unloader.unload_partitioned, query, directory, files=files,
+                                partition_by=partition_by, delimiter=delimiter, add_quotes=add_quotes,
+                                escape=escape, null_string=null_string, with_header=with_header)
+
+    async def unload_many(self, jobs: Iterable[UnloadJob]) -> List[UnloadResult]:
+        jobs = list(jobs)
+        errors = await asyncio.gather(*[self.unload(**job._asdict()) for job in jobs], return_exceptions=True)
+
+        return [UnloadResult(job=job, error=error) for job, error in zip(jobs, errors)]
+
+    async def sweep(self, orphan_age: Optional[float] = None) -> List[str]:
+        return await self.__run(self.__unloader.sweep, orphan_age)
+
+    async def list(self, path: str) -> List[str]:
+        return await self.__run(self.__s3.list, path)
+
+    async def download(self, key: str, filename: str) -> None:
+        await self.__run(self.__s3.download, key=key, filename=filename)
+
+    async def delete(self, keys: List[str]) -> None:
+        await self.__run(self.__s3.delete, keys)
+
+    async def __run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,131 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from redshift_unloader.logger import logger
+
+LOCK_NAME = '.lock'
+ENTRY_SUFFIX = '.cache'
+
+
+class ResultCache:
+    __directory: str
+    __ttl: float
+    __max_bytes: Optional[int]
+
+    def __init__(self, directory: str, ttl: float, max_bytes: Optional[int] = None) -> None:
+        if ttl <= 0:
+            raise ValueError(f"ttl must be positive: {ttl}")
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError(f"max_bytes must not be negative: {max_bytes}")
+
+        self.__directory = directory
+        self.__ttl = ttl
+        self.__max_bytes = max_bytes
+        os.makedirs(directory, 0o700, exist_ok=True)
+
+    @staticmethod
+    def key(query: str, options: Dict[str, Any]) -> str:
+        document = json.dumps({'query': ResultCache.__normalize(query), 'options': options}, sort_keys=True)
+        return hashlib.sha256(document.encode()).hexdigest()
+
+    def get(self, key: str, filename: str) -> bool:
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as entry:
+                created = os.fstat(entry.fileno()).st_mtime
+                if time.time() - created > self.__ttl:
+                    logger.debug("Cache entry %s expired", key)
+                    return False
+
+                with open(filename, 'wb') as out:
+                    shutil.copyfileobj(entry, out, 2 * 1024 * 1024)
+        except FileNotFoundError:
+            return False
+
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path, (time.time(), created))
+
+        logger.debug("Cache hit: %s", key)
+        return True
+
+    def put(self, key: str, filename: str) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as entry, open(filename, 'rb') as read:
+                shutil.copyfileobj(read, entry, 2 * 1024 * 1024)
+            os.replace(temp_path, self.__path(key))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+
+        logger.debug("Cache stored: %s", key)
+        self.evict()
+
+    def evict(self) -> None:
+        with self.__lock():
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.__directory):
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(self.__directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                if now - stat.st_mtime > self.__ttl:
+                    self.__remove(path)
+                else:
+                    entries.append((stat.st_atime, stat.st_size, path))
+
+            if self.__max_bytes is None:
+                return
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.__max_bytes:
+                    break
+                self.__remove(path)
+                total -= size
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.__directory, key + ENTRY_SUFFIX)
+
+    @contextlib.contextmanager
+    def __lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+
+        with open(os.path.join(self.__directory, LOCK_NAME), 'w') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def __remove(path: str) -> None:
+        logger.debug("Evict cache entry %s", path)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    @staticmethod
+    def __normalize(query: str) -> str:
+        parts = re.split(r"('(?:[^'\\]|\\.|'')*')", query.strip().rstrip(';'))
+        return ''.join(part if i % 2 else re.sub(r'\s+', ' ', part) for i, part in enumerate(parts)).strip()
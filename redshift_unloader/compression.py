@@ -0,0 +1,180 @@
+import collections
+import concurrent.futures
+import struct
+import zlib
+
+from typing import Any, BinaryIO, Deque, Iterable, Iterator, Optional
+
+from redshift_unloader.output import write_all
+
+GZIP = 'gzip'
+GZIP_SINGLE = 'gzip_single'
+PLAIN = 'plain'
+ZSTD = 'zstd'
+CODECS = (GZIP, GZIP_SINGLE, PLAIN, ZSTD)
+
+DEFAULT_BLOCK_SIZE = 128 * 1024
+DEFAULT_LEVEL = 6
+DICTIONARY_SIZE = 32 * 1024
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+def _require_zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is required for the zstd codec: pip install redshift-unloader[zstd]") from None
+    return zstandard
+
+
+def validate(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"codec must be one of {', '.join(CODECS)}: {codec}")
+
+
+def decompress(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            if not decompressor.eof:
+                break
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def open_encoder(codec: str, fileobj: BinaryIO, concurrency: int = 1) -> 'Encoder':
+    validate(codec)
+    if codec == GZIP_SINGLE:
+        return ParallelGzipEncoder(fileobj, concurrency)
+    if codec == ZSTD:
+        return ZstdEncoder(fileobj, concurrency)
+    if codec == PLAIN:
+        return Encoder(fileobj)
+    raise ValueError(f"{codec} output is not encoded from plain text")
+
+
+class Encoder:
+    _fileobj: BinaryIO
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self._fileobj = fileobj
+
+    def __enter__(self) -> 'Encoder':
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data: bytes) -> None:
+        write_all(self._fileobj, data)
+
+    def close(self) -> None:
+        self._fileobj.flush()
+
+    def abort(self) -> None:
+        pass
+
+
+class ZstdEncoder(Encoder):
+    __compressor: 'zstandard.ZstdCompressionObj'
+
+    def __init__(self, fileobj: BinaryIO, concurrency: int = 1) -> None:
+        zstandard = _require_zstandard()
+        super().__init__(fileobj)
+        self.__compressor = zstandard.ZstdCompressor(threads=concurrency if concurrency > 1 else 0).compressobj()
+
+    def write(self, data: bytes) -> None:
+        write_all(self._fileobj, self.__compressor.compress(data))
+
+    def close(self) -> None:
+        if self.__compressor is not None:
+            write_all(self._fileobj, self.__compressor.flush())
+            self.__compressor = None
+        super().close()
+
+    def abort(self) -> None:
+        self.__compressor = None
+
+
+class ParallelGzipEncoder(Encoder):
+    __executor: Optional[concurrent.futures.ThreadPoolExecutor]
+    __pending: Deque[concurrent.futures.Future]
+    __max_pending: int
+    __block_size: int
+    __level: int
+    __buffer: bytearray
+    __dictionary: bytes
+    __crc: int
+    __size: int
+
+    def __init__(self, fileobj: BinaryIO, concurrency: int = 1,
+                 block_size: int = DEFAULT_BLOCK_SIZE, level: int = DEFAULT_LEVEL) -> None:
+        if block_size < 1:
+            raise ValueError(f"block_size must be positive: {block_size}")
+
+        super().__init__(fileobj)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self.__pending = collections.deque()
+        self.__max_pending = 2 * concurrency
+        self.__block_size = block_size
+        self.__level = level
+        self.__buffer = bytearray()
+        self.__dictionary = b''
+        self.__crc = 0
+        self.__size = 0
+
+        write_all(self._fileobj, GZIP_HEADER)
+
+    def write(self, data: bytes) -> None:
+        self.__buffer += data
+        while len(self.__buffer) >= self.__block_size:
+            block = bytes(self.__buffer[:self.__block_size])
+            del self.__buffer[:self.__block_size]
+            self.__submit(block, last=False)
+
+    def close(self) -> None:
+        if self.__executor is None:
+            return
+
+        try:
+            self.__submit(bytes(self.__buffer), last=True)
+            self.__buffer = bytearray()
+            while self.__pending:
+                write_all(self._fileobj, self.__pending.popleft().result())
+            write_all(self._fileobj, struct.pack('<II', self.__crc, self.__size & 0xffffffff))
+        finally:
+            self.abort()
+        super().close()
+
+    def abort(self) -> None:
+        if self.__executor is None:
+            return
+
+        for future in self.__pending:
+            future.cancel()
+        self.__pending.clear()
+        self.__executor.shutdown(wait=True)
+        self.__executor = None
+
+    def __submit(self, block: bytes, last: bool) -> None:
+        self.__pending.append(self.__executor.submit(self.__deflate, block, self.__dictionary, last, self.__level))
+        self.__dictionary = block[-DICTIONARY_SIZE:]
+        self.__crc = zlib.crc32(block, self.__crc)
+        self.__size += len(block)
+
+        while len(self.__pending) > self.__max_pending:
+            write_all(self._fileobj, self.__pending.popleft().result())
+
+    @staticmethod
+    def __deflate(block: bytes, dictionary: bytes, last: bool, level: int) -> bytes:
+        if dictionary:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
@@ -0,0 +1,73 @@
+import csv
+import io
+
+from typing import Any, Dict, List
+
+from redshift_unloader.redshift import Column
+
+BOOL = 16
+INT8 = 20
+INT2 = 21
+INT4 = 23
+FLOAT4 = 700
+FLOAT8 = 701
+NUMERIC = 1700
+DATE = 1082
+TIMESTAMP = 1114
+TIMESTAMPTZ = 1184
+
+DTYPES = {
+    BOOL: 'boolean',
+    INT2: 'Int16',
+    INT4: 'Int32',
+    INT8: 'Int64',
+    FLOAT4: 'float32',
+    FLOAT8: 'float64',
+    NUMERIC: 'float64',
+}
+DATETIME_TYPES = (DATE, TIMESTAMP, TIMESTAMPTZ)
+
+
+def _require_pandas() -> Any:
+    try:
+        import pandas
+    except ImportError:
+        raise ImportError("pandas is required for DataFrame unloads: pip install redshift-unloader[pandas]") from None
+    return pandas
+
+
+def dtypes(columns: List[Column]) -> Dict[str, str]:
+    return {column.name: DTYPES.get(column.type_code, 'object') for column in columns
+            if column.type_code not in DATETIME_TYPES}
+
+
+def parse_slice(data: bytes, columns: List[Column], delimiter: str = ',', add_quotes: bool = True,
+                escape: bool = True, null_string: str = '') -> 'pandas.DataFrame':
+    pandas = _require_pandas()
+    return pandas.read_csv(io.BytesIO(data), compression='gzip', header=None,
+                           names=[column.name for column in columns],
+                           dtype=dtypes(columns),
+                           parse_dates=[column.name for column in columns if column.type_code in DATETIME_TYPES],
+                           sep=delimiter,
+                           quotechar='"',
+                           quoting=csv.QUOTE_MINIMAL if add_quotes else csv.QUOTE_NONE,
+                           escapechar='\\' if escape else None,
+                           doublequote=not escape,
+                           na_values=[null_string],
+                           keep_default_na=False,
+                           true_values=['t', 'true'],
+                           false_values=['f', 'false'])
+
+
+def concat(frames: List['pandas.DataFrame'], columns: List[Column]) -> 'pandas.DataFrame':
+    pandas = _require_pandas()
+    if not frames:
+        empty = pandas.DataFrame({column.name: pandas.Series(dtype=DTYPES.get(column.type_code, 'object'))
+                                  for column in columns})
+        return empty.astype({column.name: 'datetime64[ns]' for column in columns
+                             if column.type_code in DATETIME_TYPES})
+    return pandas.concat(frames, ignore_index=True)
+
+
+def to_numpy(frame: 'pandas.DataFrame') -> Dict[str, 'numpy.ndarray']:
+    return {name: frame[name].to_numpy() for name in frame.columns}
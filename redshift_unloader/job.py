@@ -0,0 +1,25 @@
+from typing import NamedTuple, Optional
+
+from redshift_unloader.compression import GZIP
+
+
+class UnloadJob(NamedTuple):
+    query: str
+    filename: str
+    delimiter: str = ','
+    add_quotes: bool = True
+    escape: bool = True
+    null_string: str = ''
+    with_header: bool = True
+    manifest: bool = False
+    resume: bool = False
+    codec: str = GZIP
+
+
+class UnloadResult(NamedTuple):
+    job: UnloadJob
+    error: Optional[BaseException] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
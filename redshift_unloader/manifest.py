@@ -0,0 +1,38 @@
+import json
+import urllib.parse
+
+from typing import List, NamedTuple
+
+
+class ManifestEntry(NamedTuple):
+    key: str
+    content_length: int
+    record_count: int
+
+
+class Manifest(NamedTuple):
+    entries: List[ManifestEntry]
+    columns: List[str]
+
+    @property
+    def record_count(self) -> int:
+        return sum(entry.record_count for entry in self.entries)
+
+    @property
+    def content_length(self) -> int:
+        return sum(entry.content_length for entry in self.entries)
+
+    @classmethod
+    def from_json(cls, body: str) -> 'Manifest':
+        document = json.loads(body)
+
+        entries = []
+        for entry in document.get('entries', []):
+            meta = entry.get('meta', {})
+            entries.append(ManifestEntry(key=urllib.parse.urlparse(entry['url']).path.lstrip('/'),
+                                         content_length=meta.get('content_length', 0),
+                                         record_count=meta.get('record_count', 0)))
+
+        columns = [element['name'] for element in document.get('schema', {}).get('elements', [])]
+
+        return cls(entries=entries, columns=columns)
@@ -0,0 +1,96 @@
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+import time
+
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
+
+from redshift_unloader.logger import logger
+
+GET_COLUMNS = 'get_columns'
+GET_RANGE = 'get_range'
+UNLOAD = 'unload'
+LIST = 'list'
+DOWNLOAD = 'download'
+MERGE = 'merge'
+DELETE = 'delete'
+
+_timer: 'contextvars.ContextVar[Optional[StageTimer]]' = contextvars.ContextVar('timer', default=None)
+_retries_lock = threading.Lock()
+
+
+class StageMetric(NamedTuple):
+    session_id: str
+    stage: str
+    duration: float
+    bytes: int = 0
+    objects: int = 0
+    retries: int = 0
+    error: Optional[BaseException] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+class StageTimer:
+    bytes: int
+    objects: int
+    retries: int
+
+    def __init__(self) -> None:
+        self.bytes = 0
+        self.objects = 0
+        self.retries = 0
+
+
+class ContextThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> concurrent.futures.Future:
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def count_retries(retries: int) -> None:
+    timer = _timer.get()
+    if timer is not None:
+        with _retries_lock:
+            timer.retries += retries
+
+
+class Metrics:
+    __lock: threading.Lock
+    __callbacks: List[Callable[[StageMetric], None]]
+
+    def __init__(self, *callbacks: Callable[[StageMetric], None]) -> None:
+        self.__lock = threading.Lock()
+        self.__callbacks = list(callbacks)
+
+    def subscribe(self, callback: Callable[[StageMetric], None]) -> None:
+        with self.__lock:
+            self.__callbacks.append(callback)
+
+    @contextlib.contextmanager
+    def measure(self, session_id: str, stage: str) -> Iterator[StageTimer]:
+        timer = StageTimer()
+        error = None
+        started = time.perf_counter()
+        token = _timer.set(timer)
+        try:
+            yield timer
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _timer.reset(token)
+            self.record(StageMetric(session_id=session_id, stage=stage, duration=time.perf_counter() - started,
+                                    bytes=timer.bytes, objects=timer.objects, retries=timer.retries, error=error))
+
+    def record(self, metric: StageMetric) -> None:
+        with self.__lock:
+            callbacks = list(self.__callbacks)
+
+        for callback in callbacks:
+            try:
+                callback(metric)
+            except Exception as e:
+                logger.debug("Metrics callback %r failed: %s", callback, e)
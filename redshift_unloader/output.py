@@ -0,0 +1,38 @@
+import os
+import threading
+
+from typing import BinaryIO
+
+from redshift_unloader.logger import logger
+
+_seek_lock = threading.Lock()
+
+
+def preallocate(fd: int, size: int) -> None:
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            logger.debug("posix_fallocate is not available, fall back to ftruncate: %s", e)
+    os.ftruncate(fd, size)
+
+
+def write_all(fileobj: BinaryIO, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = fileobj.write(view)
+        view = view[written if written is not None else len(view):]
+
+
+def pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            with _seek_lock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                written = os.write(fd, view)
+        offset += written
+        view = view[written:]
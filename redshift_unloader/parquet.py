@@ -0,0 +1,87 @@
+from typing import Any, List, Optional
+
+from redshift_unloader import dataframe
+from redshift_unloader.logger import logger
+from redshift_unloader.redshift import Column
+
+
+def _require_pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow is required for Parquet unloads: pip install redshift-unloader[parquet]") from None
+    return pyarrow
+
+
+def read_table(filename: str) -> 'pyarrow.Table':
+    pyarrow = _require_pyarrow()
+    return pyarrow.parquet.read_table(filename)
+
+
+def concat_tables(tables: List['pyarrow.Table']) -> 'pyarrow.Table':
+    pyarrow = _require_pyarrow()
+    if not tables:
+        raise ValueError("No Parquet object to concatenate")
+    return pyarrow.concat_tables(tables)
+
+
+def schema(columns: List[Column]) -> 'pyarrow.Schema':
+    pyarrow = _require_pyarrow()
+    types = {
+        dataframe.BOOL: pyarrow.bool_(),
+        dataframe.INT2: pyarrow.int16(),
+        dataframe.INT4: pyarrow.int32(),
+        dataframe.INT8: pyarrow.int64(),
+        dataframe.FLOAT4: pyarrow.float32(),
+        dataframe.FLOAT8: pyarrow.float64(),
+        dataframe.NUMERIC: pyarrow.float64(),
+        dataframe.DATE: pyarrow.date32(),
+        dataframe.TIMESTAMP: pyarrow.timestamp('us'),
+        dataframe.TIMESTAMPTZ: pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([(column.name, types.get(column.type_code, pyarrow.string())) for column in columns])
+
+
+def empty_table(columns: List[Column]) -> 'pyarrow.Table':
+    return schema(columns).empty_table()
+
+
+class ParquetMerger:
+    __filename: str
+    __writer: Optional['pyarrow.parquet.ParquetWriter']
+
+    def __init__(self, filename: str) -> None:
+        _require_pyarrow()
+        self.__filename = filename
+        self.__writer = None
+
+    def __enter__(self) -> 'ParquetMerger':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def append(self, filename: str) -> None:
+        pyarrow = _require_pyarrow()
+        source = pyarrow.parquet.ParquetFile(filename)
+        if self.__writer is None:
+            self.__writer = pyarrow.parquet.ParquetWriter(self.__filename, source.schema_arrow)
+
+        logger.debug("Append %s row group(s) of %s", source.num_row_groups, filename)
+        for i in range(source.num_row_groups):
+            self.__writer.write_table(source.read_row_group(i))
+
+    @property
+    def empty(self) -> bool:
+        return self.__writer is None
+
+    def write_empty(self, columns: List[Column]) -> None:
+        pyarrow = _require_pyarrow()
+        logger.debug("No Parquet object, write an empty file with %s column(s)", len(columns))
+        self.__writer = pyarrow.parquet.ParquetWriter(self.__filename, schema(columns))
+
+    def close(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
@@ -0,0 +1,75 @@
+import heapq
+import json
+import os
+import posixpath
+import urllib.parse
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from redshift_unloader.s3 import S3Object
+
+INDEX_NAME = 'index.json'
+HIVE_DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+class PartitionFile(NamedTuple):
+    path: str
+    partition: Dict[str, Optional[str]]
+    rows: Optional[int]
+    bytes: int
+
+
+def balance(objects: List[S3Object], files: int) -> List[List[S3Object]]:
+    if files < 1:
+        raise ValueError(f"files must be positive: {files}")
+
+    bins: List[Tuple[int, int]] = [(0, i) for i in range(min(files, len(objects)) or 1)]
+    assigned: List[List[int]] = [[] for _ in bins]
+    for index in sorted(range(len(objects)), key=lambda i: -objects[i].size):
+        size, i = heapq.heappop(bins)
+        assigned[i].append(index)
+        heapq.heappush(bins, (size + objects[index].size, i))
+
+    return [[objects[index] for index in sorted(indices)] for indices in assigned]
+
+
+def group(objects: List[S3Object], prefix: str) -> Dict[str, List[S3Object]]:
+    groups: Dict[str, List[S3Object]] = {}
+    for obj in objects:
+        if not obj.key.startswith(prefix):
+            raise ValueError(f"object is outside of the unload path {prefix}: {obj.key}")
+        groups.setdefault(posixpath.dirname(obj.key[len(prefix):]), []).append(obj)
+
+    return groups
+
+
+def parse(directory: str) -> Dict[str, Optional[str]]:
+    partition: Dict[str, Optional[str]] = {}
+    for segment in filter(None, directory.split('/')):
+        name, _, value = segment.partition('=')
+        value = urllib.parse.unquote(value)
+        partition[name] = value if value != HIVE_DEFAULT_PARTITION else None
+
+    return partition
+
+
+def rows(objects: List[S3Object]) -> Optional[int]:
+    if any(obj.record_count is None for obj in objects):
+        return None
+    return sum(obj.record_count for obj in objects)
+
+
+def write_index(directory: str, columns: List[str], partition_by: List[str], files: List[PartitionFile]) -> str:
+    document = {
+        'columns': columns,
+        'partition_by': partition_by,
+        'files': [file._asdict() for file in files],
+    }
+
+    path = os.path.join(directory, INDEX_NAME)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(document, f, indent=2)
+    os.replace(temp_path, path)
+
+    return path
@@ -0,0 +1,77 @@
+import contextlib
+import os
+import queue
+import threading
+
+from typing import Callable, Dict, Generic, Hashable, Iterator, TypeVar
+
+from redshift_unloader.logger import logger
+
+T = TypeVar('T')
+
+_shared: Dict[Hashable, 'Pool'] = {}
+_shared_lock = threading.Lock()
+
+
+class Pool(Generic[T]):
+    __factory: Callable[[], T]
+    __size: int
+    __created: int
+    __idle: queue.LifoQueue
+    __lock: threading.Lock
+
+    def __init__(self, factory: Callable[[], T], size: int) -> None:
+        if size < 1:
+            raise ValueError(f"size must be positive: {size}")
+
+        self.__factory = factory
+        self.__size = size
+        self.__created = 0
+        self.__idle = queue.LifoQueue()
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[T]:
+        item = self.__get()
+        try:
+            yield item
+        finally:
+            self.__idle.put(item)
+
+    def __get(self) -> T:
+        try:
+            return self.__idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.__lock:
+            create = self.__created < self.__size
+            if create:
+                self.__created += 1
+
+        if not create:
+            return self.__idle.get()
+
+        try:
+            item = self.__factory()
+        except BaseException:
+            with self.__lock:
+                self.__created -= 1
+            raise
+
+        logger.debug("Create pooled item %s/%s", self.__created, self.__size)
+        return item
+
+
+def shared(key: Hashable, factory: Callable[[], T], size: int) -> Pool[T]:
+    key = (os.getpid(), key)
+    with _shared_lock:
+        pool = _shared.get(key)
+        if pool is None:
+            logger.debug("Create shared pool of %s item(s)", size)
+            pool = _shared[key] = Pool(factory, size)
+        return pool
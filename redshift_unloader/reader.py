@@ -0,0 +1,22 @@
+import csv
+import io
+
+from typing import BinaryIO, Iterator, List, Optional
+
+
+def iter_rows(stream: BinaryIO, delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+              null_string: str = '', encoding: str = 'utf-8') -> Iterator[List[Optional[str]]]:
+    text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    try:
+        rows = csv.reader(text,
+                          delimiter=delimiter,
+                          quotechar='"',
+                          quoting=csv.QUOTE_MINIMAL if add_quotes else csv.QUOTE_NONE,
+                          escapechar='\\' if escape else None,
+                          doublequote=not escape,
+                          strict=True)
+
+        for row in rows:
+            yield [None if value == null_string else value for value in row]
+    finally:
+        text.detach()
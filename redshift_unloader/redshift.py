@@ -1,36 +1,46 @@
-import psycopg2
-import psycopg2.extensions
 import re
 
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from redshift_unloader.credential import Credential
 from redshift_unloader.logger import logger
 
+KEEPALIVES_IDLE = 60
+KEEPALIVES_INTERVAL = 10
+KEEPALIVES_COUNT = 5
+
+
+class Column(NamedTuple):
+    name: str
+    type_code: int
+
 
 class Redshift:
     __credential: Credential
-    __connection: psycopg2.extensions.connection
-    __cursor: psycopg2.extensions.cursor
+    __parameters: Dict[str, Any]
+    __connection: Optional['psycopg2.extensions.connection']
+    __cursor: Optional['psycopg2.extensions.cursor']
 
     def __init__(self, host: str, port: int, user: str, password: str,
                  database: str, credential: Credential) -> None:
         self.__credential = credential
-        self.__connection = psycopg2.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database)
-        self.__connection.autocommit = True
-        self.__cursor = self.__connection.cursor()
+        self.__parameters = dict(host=host, port=port, user=user, password=password, database=database)
+        self.__connection = None
+        self.__cursor = None
 
     def __del__(self) -> None:
+        self.close()
+
+    def close(self) -> None:
         try:
-            self.__connection.close()
-            self.__cursor.close()
+            if self.__cursor is not None:
+                self.__cursor.close()
+            if self.__connection is not None:
+                self.__connection.close()
         except:
             pass
+        self.__connection = None
+        self.__cursor = None
 
     def get_columns(self, query: str, add_quotes: bool = True) -> List[str]:
         quote = '"' if add_quotes else ''
@@ -38,17 +48,67 @@ class Redshift:
         logger.debug("query: %s", sql)
 
         try:
-            self.__cursor.execute(sql)
-            result = [f'{quote}{column.name}{quote}' for column in self.__cursor.description]
+            cursor = self.__execute(sql)
+            result = [f'{quote}{column.name}{quote}' for column in cursor.description]
+
+            return result
+        except Exception as e:
+            raise e
+
+    def describe(self, query: str) -> List[Column]:
+        sql = self.__generate_get_columns_sql(query)
+        logger.debug("query: %s", sql)
+
+        try:
+            cursor = self.__execute(sql)
+            result = [Column(name=column.name, type_code=column.type_code) for column in cursor.description]
 
             return result
         except Exception as e:
             raise e
 
+    def get_range(self, query: str, column: str) -> Tuple[Any, Any]:
+        sql = self.__generate_get_range_sql(query, column)
+        logger.debug("query: %s", sql)
+
+        try:
+            lower, upper = self.__execute(sql).fetchone()
+
+            return lower, upper
+        except Exception as e:
+            raise e
+
+    def get_slice_count(self) -> int:
+        sql = self.__generate_get_slice_count_sql()
+        logger.debug("query: %s", sql)
+
+        try:
+            count, = self.__execute(sql).fetchone()
+
+            return count
+        except Exception as e:
+            raise e
+
+    def estimate_size(self, query: str) -> Optional[int]:
+        sql = self.__generate_explain_sql(query)
+        logger.debug("query: %s", sql)
+
+        try:
+            plan = self.__execute(sql).fetchone()
+        except Exception as e:
+            raise e
+
+        match = re.search(r'rows=(\d+) width=(\d+)', plan[0]) if plan is not None else None
+        if match is None:
+            return None
+        return int(match.group(1)) * int(match.group(2))
+
     def unload(self,
                query: str,
                s3_uri: str,
                manifest: bool = False,
+               verbose_manifest: bool = False,
+               file_format: Optional[str] = None,
                delimiter: Optional[str] = None,
                fixed_width: Optional[str] = None,
                encrypted: bool = None,
@@ -58,11 +118,14 @@ class Redshift:
                escape: bool = False,
                allow_overwrite: bool = False,
                parallel: bool = True,
-               max_file_size: Optional[str] = None) -> bool:
+               max_file_size: Optional[str] = None,
+               partition_by: Optional[List[str]] = None) -> bool:
         options: Dict[str, Optional[str]] = {}
 
         if manifest:
-            options['MANIFEST'] = None
+            options['MANIFEST'] = 'VERBOSE' if verbose_manifest else None
+        if file_format is not None:
+            options['FORMAT'] = file_format
         if delimiter is not None:
             options['DELIMITER'] = f"'{delimiter}'"
         if fixed_width is not None:
@@ -82,16 +145,61 @@ class Redshift:
         options['PARALLEL'] = 'ON' if parallel else 'OFF'
         if max_file_size is not None:
             options['MAXFILESIZE'] = max_file_size
+        if partition_by:
+            options['PARTITION BY'] = f"({', '.join(partition_by)})"
 
         sql = self.__generate_unload_sql(self.__escaped_query(query), s3_uri, self.__credential, options)
         logger.debug("query: %s", sql)
 
         try:
-            self.__cursor.execute(sql)
+            self.__execute(sql, retry=False)
             return True
         except Exception as e:
             raise e
 
+    def __execute(self, sql: str, retry: bool = True) -> 'psycopg2.extensions.cursor':
+        import psycopg2
+
+        if not retry and self.__connection is not None and not self.__connection.closed:
+            self.__execute('SELECT 1')
+
+        try:
+            cursor = self.__connect()
+            cursor.execute(sql)
+            return cursor
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if self.__connection is None or not self.__connection.closed:
+                raise
+            self.close()
+            if not retry:
+                raise
+            logger.debug("Connection to Redshift was dropped, reconnect: %s", e)
+
+        cursor = self.__connect()
+        cursor.execute(sql)
+        return cursor
+
+    def __connect(self) -> 'psycopg2.extensions.cursor':
+        if self.__connection is not None and self.__connection.closed:
+            logger.debug("Connection to Redshift was closed, reconnect")
+            self.close()
+        if self.__cursor is not None:
+            return self.__cursor
+
+        import psycopg2
+
+        logger.debug("Connect to %s:%s", self.__parameters['host'], self.__parameters['port'])
+        connection = psycopg2.connect(
+            keepalives=1,
+            keepalives_idle=KEEPALIVES_IDLE,
+            keepalives_interval=KEEPALIVES_INTERVAL,
+            keepalives_count=KEEPALIVES_COUNT,
+            **self.__parameters)
+        connection.autocommit = True
+        self.__connection = connection
+        self.__cursor = connection.cursor()
+        return self.__cursor
+
     @staticmethod
     def __escaped_query(query: str) -> str:
         return re.sub(r'[\\\']', lambda x: '\\' + x.group(), query)
@@ -100,6 +208,18 @@ class Redshift:
     def __generate_get_columns_sql(query: str) -> str:
         return f'WITH query AS ({query}) SELECT * FROM query LIMIT 0'
 
+    @staticmethod
+    def __generate_get_range_sql(query: str, column: str) -> str:
+        return f'WITH query AS ({query}) SELECT MIN({column}), MAX({column}) FROM query'
+
+    @staticmethod
+    def __generate_get_slice_count_sql() -> str:
+        return 'SELECT COUNT(*) FROM stv_slices'
+
+    @staticmethod
+    def __generate_explain_sql(query: str) -> str:
+        return f'EXPLAIN {query}'
+
     @staticmethod
     def __generate_unload_sql(query: str, s3_uri: str, credential: Credential, options: Dict) -> str:
         partial_sqls = [f"UNLOAD ('{query}') TO '{s3_uri}'"]
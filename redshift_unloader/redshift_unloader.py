@@ -1,95 +1,921 @@
+import collections
+import concurrent.futures
+import contextlib
+import decimal
+import functools
 import os
+import posixpath
 import shutil
 import tempfile
 import uuid
 import gzip
+import itertools
 import logging
+import math
+import multiprocessing
+import threading
+import time
 
+from typing import Any, BinaryIO, Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from redshift_unloader import compression, dataframe, metrics, output, parquet, partition, pool, reader, watermark
+from redshift_unloader.cache import ResultCache
 from redshift_unloader.credential import Credential
-from redshift_unloader.redshift import Redshift
-from redshift_unloader.s3 import S3
+from redshift_unloader.job import UnloadJob, UnloadResult
+from redshift_unloader.metrics import Metrics, StageMetric, StageTimer
+from redshift_unloader.partition import PartitionFile
+from redshift_unloader.pool import Pool
+from redshift_unloader.redshift import Column, Redshift
+from redshift_unloader.session import SessionState
+from redshift_unloader.watermark import Watermark, WatermarkStore
+from redshift_unloader.s3 import S3, BatchDeleter, S3Object, DEFAULT_PART_SIZE, DEFAULT_PART_CONCURRENCY
 from redshift_unloader.logger import logger
 
 KB = 1024
 MB = 1024 * 1024
 
+DEFAULT_CONCURRENCY = 8
+MANIFEST_NAME = 'manifest'
+DEFAULT_BATCH_SIZE = 10000
+PARQUET = 'PARQUET'
+SESSION_STATE_SUFFIX = '.session'
+DEFAULT_COLUMN_CACHE_SIZE = 0
+MIN_FILE_SIZE = 32 * MB
+MAX_FILE_SIZE = 6200 * MB
+COMPRESSION_RATIO = 4
+SESSION_PREFIX = '/tmp/redshift-unloader'
+DEFAULT_ORPHAN_AGE = 24 * 60 * 60
+
 
 class RedshiftUnloader:
-    __redshift: Redshift
+    __redshift_key: Hashable
+    __redshift_factory: Callable[[], Redshift]
+    __pool_size: int
     __s3: S3
     __credential: Credential
+    __concurrency: int
+    __max_in_flight: int
+    __part_size: int
+    __auto_file_size: bool
+    __slice_count: Optional[int]
+    __cache: Optional[ResultCache]
+    __source: Dict[str, Any]
+    __metrics: Metrics
+    __column_cache: 'collections.OrderedDict[str, List[str]]'
+    __column_cache_size: int
+    __column_cache_lock: threading.Lock
+    __deleters: Dict[str, BatchDeleter]
+    __deleters_lock: threading.Lock
+    __sweep_orphans: bool
+    __orphan_age: float
+    __sweeper: Optional[threading.Thread]
 
     def __init__(self, host: str, port: int, user: str, password: str,
                  database: str, s3_bucket: str, access_key_id: str,
-                 secret_access_key: str, region: str, verbose: bool = False) -> None:
+                 secret_access_key: str, region: str, verbose: bool = False,
+                 concurrency: int = DEFAULT_CONCURRENCY, max_in_flight: Optional[int] = None,
+                 part_size: int = DEFAULT_PART_SIZE, part_concurrency: int = DEFAULT_PART_CONCURRENCY,
+                 pool_size: int = 1, cache: Optional[ResultCache] = None,
+                 metrics: Optional[Metrics] = None, column_cache_size: int = DEFAULT_COLUMN_CACHE_SIZE,
+                 auto_file_size: bool = False, sweep_orphans: bool = False,
+                 orphan_age: float = DEFAULT_ORPHAN_AGE) -> None:
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be positive: {concurrency}")
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be positive: {max_in_flight}")
+        if part_size < 1:
+            raise ValueError(f"part_size must be positive: {part_size}")
+        if part_concurrency < 1:
+            raise ValueError(f"part_concurrency must be positive: {part_concurrency}")
+        if column_cache_size < 0:
+            raise ValueError(f"column_cache_size must not be negative: {column_cache_size}")
+        if orphan_age <= 0:
+            raise ValueError(f"orphan_age must be positive: {orphan_age}")
+
+        self.__concurrency = concurrency
+        self.__max_in_flight = max_in_flight if max_in_flight is not None else 2 * concurrency
+        self.__part_size = part_size
+        self.__auto_file_size = auto_file_size
+        self.__slice_count = None
+        self.__cache = cache
+        self.__source = dict(host=host, port=port, database=database, user=user, s3_bucket=s3_bucket)
+        self.__metrics = metrics if metrics is not None else Metrics()
+        self.__column_cache = collections.OrderedDict()
+        self.__column_cache_size = column_cache_size
+        self.__column_cache_lock = threading.Lock()
+        self.__deleters = {}
+        self.__deleters_lock = threading.Lock()
+        self.__sweep_orphans = sweep_orphans
+        self.__orphan_age = orphan_age
+        self.__sweeper = None
         credential = Credential(
             access_key_id=access_key_id, secret_access_key=secret_access_key)
-        self.__redshift = Redshift(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database,
-            credential=credential)
-        self.__s3 = S3(credential=credential, bucket=s3_bucket, region=region)
+        self.__redshift_key = (Redshift, host, port, user, password, database, credential, pool_size)
+        self.__redshift_factory = functools.partial(Redshift, host=host, port=port, user=user, password=password,
+                                                    database=database, credential=credential)
+        self.__pool_size = pool_size
+        self.__s3 = S3(credential=credential, bucket=s3_bucket, region=region,
+                       max_pool_connections=concurrency * part_concurrency,
+                       part_size=part_size, part_concurrency=part_concurrency)
         if verbose:
             logger.disabled = False
             logger.setLevel(logging.DEBUG)
         else:
             logger.disabled = True
 
-
     def unload(self, query: str, filename: str,
                delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
-               null_string: str = '', with_header: bool = True) -> None:
+               null_string: str = '', with_header: bool = True, manifest: bool = False,
+               split_column: Optional[str] = None, partitions: int = 1, resume: bool = False,
+               codec: str = compression.GZIP) -> None:
+        self.__validate_partitions(split_column, partitions)
+        compression.validate(codec)
+        if resume and codec != compression.GZIP:
+            raise ValueError(f"resume is only supported with the {compression.GZIP} codec: {codec}")
+
+        cache_key = self.__cache_key(query, gzip=True, delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                                     null_string=null_string, with_header=with_header, codec=codec)
+        if self.__cache_get(cache_key, filename):
+            return
+
+        self.__unload_gzip(query, lambda session_id, objects, header, state:
+                           self.__write_file(session_id, objects, filename, header, state, codec),
+                           delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                           null_string=null_string, with_header=with_header, manifest=manifest,
+                           split_column=split_column, partitions=partitions,
+                           state_file=filename + SESSION_STATE_SUFFIX if resume else None)
+
+        self.__cache_put(cache_key, filename)
+
+    def unload_fileobj(self, query: str, fileobj: BinaryIO,
+                       delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                       null_string: str = '', with_header: bool = True, manifest: bool = False,
+                       split_column: Optional[str] = None, partitions: int = 1,
+                       codec: str = compression.GZIP) -> None:
+        self.__validate_partitions(split_column, partitions)
+        compression.validate(codec)
+
+        self.__unload_gzip(query, lambda session_id, objects, header, _:
+                           self.__stream_into(session_id, objects, fileobj, header, codec),
+                           delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                           null_string=null_string, with_header=with_header, manifest=manifest,
+                           split_column=split_column, partitions=partitions)
+
+    def unload_to_s3(self, query: str, key: str,
+                     delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                     null_string: str = '', with_header: bool = True, manifest: bool = False,
+                     split_column: Optional[str] = None, partitions: int = 1) -> str:
+        self.__validate_partitions(split_column, partitions)
+
+        self.__unload_gzip(query, lambda session_id, objects, header, _:
+                           self.__concatenate(session_id, objects, key, header),
+                           delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                           null_string=null_string, with_header=with_header, manifest=manifest,
+                           split_column=split_column, partitions=partitions)
+
+        return self.__s3.uri(key)
+
+    def unload_partitioned(self, query: str, directory: str, files: int = 1,
+                           partition_by: Optional[List[str]] = None,
+                           delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                           null_string: str = '', with_header: bool = True) -> List[PartitionFile]:
+        if files < 1:
+            raise ValueError(f"files must be positive: {files}")
+        partition_by = list(partition_by) if partition_by is not None else []
+
+        with self.__unload_session(query, True, gzip=True, delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                                   null_string=null_string, partition_by=partition_by or None) \
+                as (session_id, objects, unloaded_columns, _):
+            columns = [column for column in unloaded_columns or self.__get_columns(query, False)
+                       if column not in partition_by]
+            quote = '"' if add_quotes else ''
+            header = gzip.compress((delimiter.join(f'{quote}{column}{quote}' for column in columns)
+                                    + os.linesep).encode()) if with_header else b''
+
+            prefix = self.__generate_path(SESSION_PREFIX, session_id, '/').lstrip('/')
+            layout = [(posixpath.join(name, f'part-{i:05d}.gz'), file_objects)
+                      for name, group in sorted(partition.group(objects, prefix).items())
+                      for i, file_objects in enumerate(partition.balance(group, files))]
+
+            logger.debug("Write %s object(s) into %s file(s) under %s", len(objects), len(layout), directory)
+            self.__download_files(session_id, directory, header, layout)
+
+        result = [PartitionFile(path=path, partition=partition.parse(posixpath.dirname(path)),
+                                rows=partition.rows(file_objects),
+                                bytes=len(header) + sum(obj.size for obj in file_objects))
+                  for path, file_objects in layout]
+        logger.debug("Write the index: %s", partition.write_index(directory, columns, partition_by, result))
+
+        return result
+
+    def unload_incremental(self, query: str, filename: str, watermark_column: str, store: WatermarkStore,
+                           mode: str = watermark.APPEND, key: Optional[str] = None,
+                           delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                           null_string: str = '', with_header: bool = True, manifest: bool = False) -> Optional[str]:
+        if mode not in (watermark.APPEND, watermark.ROLL):
+            raise ValueError(f"mode must be {watermark.APPEND} or {watermark.ROLL}: {mode}")
+
+        key = key if key is not None else filename
+        previous = store.load(key)
+        lower = previous.value if previous is not None else None
+        logger.debug("Watermark of %s: %s", key, lower)
+
+        with self.__redshift_pool.acquire() as redshift:
+            _, upper = redshift.get_range(self.__generate_incremental_query(query, watermark_column, lower),
+                                          watermark_column)
+        if upper is None:
+            logger.debug("No rows past the watermark of %s", key)
+            return None
+
+        run = previous.run + 1 if previous is not None else 1
+        if mode == watermark.ROLL:
+            filename = self.__generate_roll_filename(filename, run)
+        base = os.path.getsize(filename) if mode == watermark.APPEND and os.path.isfile(filename) else 0
+
+        self.__unload_gzip(self.__generate_incremental_query(query, watermark_column, lower, upper),
+                           lambda session_id, objects, header, state:
+                           self.__download_into(session_id, objects, filename,
+                                                gzip.compress(header) if header else b'', state, base=base),
+                           delimiter=delimiter, add_quotes=add_quotes, escape=escape, null_string=null_string,
+                           with_header=with_header and base == 0, manifest=manifest, split_column=None,
+                           partitions=1)
+
+        store.save(key, Watermark(value=upper, run=run))
+        return filename
+
+    def unload_parquet(self, query: str, filename: str, manifest: bool = False) -> None:
+        cache_key = self.__cache_key(query, file_format=PARQUET)
+        if self.__cache_get(cache_key, filename):
+            return
+
+        with parquet.ParquetMerger(filename) as merger:
+            self.__download_objects(query, manifest, merger.append, file_format=PARQUET)
+            if merger.empty:
+                merger.write_empty(self.__describe(query))
+
+        self.__cache_put(cache_key, filename)
+
+    def unload_arrow(self, query: str, manifest: bool = False) -> 'pyarrow.Table':
+        tables: List['pyarrow.Table'] = []
+        self.__download_objects(query, manifest, lambda local_file: tables.append(parquet.read_table(local_file)),
+                                file_format=PARQUET)
+        if not tables:
+            return parquet.empty_table(self.__describe(query))
+
+        return parquet.concat_tables(tables)
+
+    def unload_dataframe(self, query: str,
+                         delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                         null_string: str = '', manifest: bool = False,
+                         max_workers: Optional[int] = None) -> 'pandas.DataFrame':
+        dataframe._require_pandas()
+        if max_workers is not None and max_workers < 1:
+            raise ValueError(f"max_workers must be positive: {max_workers}")
+
+        columns = self.__describe(query)
+
+        parse = functools.partial(dataframe.parse_slice, columns=columns, delimiter=delimiter,
+                                  add_quotes=add_quotes, escape=escape, null_string=null_string)
+
+        with self.__unload_session(query, manifest, gzip=True, delimiter=delimiter, add_quotes=add_quotes,
+                                   escape=escape, null_string=null_string) as (session_id, objects, _, _):
+            objects = [obj for obj in objects if obj.size > 0]
+
+            workers = max_workers or os.cpu_count() or 1
+            logger.debug("Download %s object(s) and parse them in %s process(es)", len(objects), workers)
+            with self.__metrics.measure(session_id, metrics.DOWNLOAD) as timer, \
+                    concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                           mp_context=self.__mp_context()) as processes:
+                timer.objects = len(objects)
+                timer.bytes = sum(obj.size for obj in objects)
+
+                parsed: List[concurrent.futures.Future] = []
+                try:
+                    for data in self.__read_objects(session_id, objects):
+                        pending = [future for future in parsed if not future.done()]
+                        if len(pending) >= workers:
+                            concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        parsed.append(processes.submit(parse, data))
+                    frames = [future.result() for future in parsed]
+                except BaseException:
+                    for future in parsed:
+                        future.cancel()
+                    raise
+
+        return dataframe.concat(frames, columns)
+
+    def unload_numpy(self, query: str,
+                     delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                     null_string: str = '', manifest: bool = False,
+                     max_workers: Optional[int] = None) -> Dict[str, 'numpy.ndarray']:
+        return dataframe.to_numpy(self.unload_dataframe(query, delimiter=delimiter, add_quotes=add_quotes,
+                                                        escape=escape, null_string=null_string, manifest=manifest,
+                                                        max_workers=max_workers))
+
+    def unload_many(self, jobs: Iterable[UnloadJob], max_jobs: Optional[int] = None) -> List[UnloadResult]:
+        max_jobs = max_jobs if max_jobs is not None else 2 * self.__redshift_pool.size
+        if max_jobs < 1:
+            raise ValueError(f"max_jobs must be positive: {max_jobs}")
+
+        logger.debug("Run jobs with %s worker(s) over %s connection(s)", max_jobs, self.__redshift_pool.size)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_jobs) as executor:
+            futures = [(job, executor.submit(self.unload, **job._asdict())) for job in jobs]
+
+            results = []
+            for job, future in futures:
+                error = future.exception()
+                if error is not None:
+                    logger.debug("Job for %s failed: %s", job.filename, error)
+                results.append(UnloadResult(job=job, error=error))
+
+        return results
+
+    def iter_rows(self, query: str,
+                  delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                  null_string: str = '', manifest: bool = False) -> Iterator[List[Optional[str]]]:
         session_id = self.__generate_session_id()
         logger.debug("Session id: %s", session_id)
 
-        s3_path = self.__generate_path("/tmp/redshift-unloader", session_id, '/')
-        local_path = self.__generate_path(tempfile.gettempdir(), session_id)
+        s3_path = self.__generate_path(SESSION_PREFIX, session_id, '/')
+        manifest_key = s3_path.lstrip('/') + MANIFEST_NAME
+
+        objects, _ = self.__unload_objects(session_id, query, s3_path, manifest, gzip=True, delimiter=delimiter,
+                                           add_quotes=add_quotes, escape=escape, null_string=null_string)
+        s3_keys = [obj.key for obj in objects]
+
+        try:
+            for s3_key in s3_keys:
+                logger.debug("Stream rows from %s", s3_key)
+                with contextlib.closing(self.__s3.open(s3_key)) as body, \
+                        gzip.GzipFile(fileobj=body, mode='rb') as stream:
+                    yield from reader.iter_rows(stream, delimiter=delimiter, add_quotes=add_quotes,
+                                                escape=escape, null_string=null_string)
+        finally:
+            self.__delete(session_id, s3_keys + [manifest_key] if manifest else s3_keys)
+
+    def iter_batches(self, query: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                     delimiter: str = ',', add_quotes: bool = True, escape: bool = True,
+                     null_string: str = '', manifest: bool = False) -> Iterator[List[List[Optional[str]]]]:
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive: {batch_size}")
+
+        rows = self.iter_rows(query, delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                              null_string=null_string, manifest=manifest)
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                yield batch
+        finally:
+            rows.close()
+
+    def sweep(self, orphan_age: Optional[float] = None) -> List[str]:
+        orphan_age = orphan_age if orphan_age is not None else self.__orphan_age
+        prefix = SESSION_PREFIX.lstrip('/') + '/'
+        cutoff = time.time() - orphan_age
+
+        sessions: Dict[str, List[Tuple[str, float]]] = {}
+        for key, modified in self.__s3.list_modified(prefix):
+            sessions.setdefault(key[len(prefix):].split('/', 1)[0], []).append((key, modified))
+
+        orphans = sorted(session_id for session_id, objects in sessions.items()
+                         if all(modified < cutoff for _, modified in objects))
+        if orphans:
+            logger.debug("Remove %s orphaned session(s) older than %s seconds", len(orphans), orphan_age)
+            self.__s3.delete([key for session_id in orphans for key, _ in sessions[session_id]])
+
+        return orphans
+
+    @staticmethod
+    def __mp_context() -> multiprocessing.context.BaseContext:
+        methods = multiprocessing.get_all_start_methods()
+        return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+    @staticmethod
+    def __validate_partitions(split_column: Optional[str], partitions: int) -> None:
+        if partitions < 1:
+            raise ValueError(f"partitions must be positive: {partitions}")
+        if partitions > 1 and split_column is None:
+            raise ValueError("split_column is required to split the query into partitions")
+
+    def __unload_gzip(self, query: str,
+                      write: Callable[[str, List[S3Object], bytes, Optional[SessionState]], None],
+                      delimiter: str, add_quotes: bool, escape: bool, null_string: str, with_header: bool,
+                      manifest: bool, split_column: Optional[str], partitions: int,
+                      state_file: Optional[str] = None) -> None:
+        columns, columns_duration = None, None
+        if with_header and not manifest:
+            started = time.perf_counter()
+            columns = self.__get_columns(query, add_quotes)
+            columns_duration = time.perf_counter() - started
+
+        fingerprint = ResultCache.key(query, dict(delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                                                  null_string=null_string, with_header=with_header,
+                                                  manifest=manifest, split_column=split_column,
+                                                  partitions=partitions, columns=columns))
+
+        with self.__unload_session(query, manifest, split_column=split_column, partitions=partitions,
+                                   state_file=state_file, fingerprint=fingerprint, gzip=True,
+                                   delimiter=delimiter, add_quotes=add_quotes, escape=escape,
+                                   null_string=null_string) as (session_id, objects, unloaded_columns, state):
+            if with_header and columns is None:
+                if unloaded_columns:
+                    logger.debug("Take columns from the manifest")
+                    quote = '"' if add_quotes else ''
+                    columns = [f'{quote}{column}{quote}' for column in unloaded_columns]
+                    self.__put_columns(query, add_quotes, columns)
+                else:
+                    started = time.perf_counter()
+                    columns = self.__get_columns(query, add_quotes)
+                    columns_duration = time.perf_counter() - started
+
+            if columns_duration is not None:
+                self.__metrics.record(StageMetric(session_id=session_id, stage=metrics.GET_COLUMNS,
+                                                  duration=columns_duration, objects=len(columns)))
+
+            header = (delimiter.join(columns) + os.linesep).encode() if columns is not None else b''
+            write(session_id, objects, header, state)
+
+    def __describe(self, query: str) -> List[Column]:
+        logger.debug("Describe columns")
+        with self.__redshift_pool.acquire() as redshift:
+            return redshift.describe(query)
+
+    def __get_columns(self, query: str, add_quotes: bool) -> List[str]:
+        key = ResultCache.key(query, dict(add_quotes=add_quotes))
+        with self.__column_cache_lock:
+            columns = self.__column_cache.get(key)
+            if columns is not None:
+                logger.debug("Take columns from the column cache: %s", key)
+                self.__column_cache.move_to_end(key)
+                return columns
 
         logger.debug("Get columns")
-        columns = self.__redshift.get_columns(query, add_quotes) if with_header else None
+        with self.__redshift_pool.acquire() as redshift:
+            columns = redshift.get_columns(query, add_quotes)
+
+        self.__put_columns(query, add_quotes, columns)
+        return columns
+
+    def __put_columns(self, query: str, add_quotes: bool, columns: List[str]) -> None:
+        if self.__column_cache_size == 0:
+            return
+
+        with self.__column_cache_lock:
+            self.__column_cache[ResultCache.key(query, dict(add_quotes=add_quotes))] = columns
+            while len(self.__column_cache) > self.__column_cache_size:
+                self.__column_cache.popitem(last=False)
+
+    @property
+    def __redshift_pool(self) -> Pool[Redshift]:
+        return pool.shared(self.__redshift_key, self.__redshift_factory, self.__pool_size)
+
+    def __cache_key(self, query: str, **options: Any) -> Optional[str]:
+        return ResultCache.key(query, dict(options, **self.__source)) if self.__cache is not None else None
+
+    def __cache_get(self, key: Optional[str], filename: str) -> bool:
+        if key is None:
+            return False
+
+        logger.debug("Look up the result cache: %s", key)
+        return self.__cache.get(key, filename)
+
+    def __cache_put(self, key: Optional[str], filename: str) -> None:
+        if key is not None:
+            logger.debug("Store the result into the cache: %s", key)
+            self.__cache.put(key, filename)
+
+    @contextlib.contextmanager
+    def __unload_session(self, query: str, manifest: bool, split_column: Optional[str] = None, partitions: int = 1,
+                         state_file: Optional[str] = None, fingerprint: str = '',
+                         **options: Any) -> Iterator[Tuple[str, List[S3Object], List[str], Optional[SessionState]]]:
+        state = self.__resume_session(state_file, fingerprint) if state_file is not None else None
+
+        if state is not None:
+            session_id, s3_paths, objects, columns = state.session_id, state.s3_paths, state.objects, state.columns
+            logger.debug("Resume session id: %s", session_id)
+        else:
+            session_id = self.__generate_session_id()
+            logger.debug("Session id: %s", session_id)
+
+            s3_path = self.__generate_path(SESSION_PREFIX, session_id, '/')
+
+            if partitions > 1:
+                s3_paths, objects, columns = self.__unload_partitions(session_id, query, s3_path, manifest,
+                                                                      split_column, partitions, **options)
+            else:
+                s3_paths = [s3_path]
+                objects, columns = self.__unload_objects(session_id, query, s3_path, manifest, **options)
+
+            if state_file is not None:
+                state = SessionState(path=state_file, session_id=session_id, fingerprint=fingerprint,
+                                     s3_paths=s3_paths, objects=objects, columns=columns)
+                state.save()
+
+        deleter = BatchDeleter(self.__s3.delete)
+        if state is None:
+            with self.__deleters_lock:
+                self.__deleters[session_id] = deleter
+
+        try:
+            with deleter:
+                yield session_id, objects, columns, state
+
+                manifest_keys = [path.lstrip('/') + MANIFEST_NAME for path in s3_paths] if manifest else []
+                logger.debug("Remove all remaining objects in S3")
+                with self.__metrics.measure(session_id, metrics.DELETE) as timer:
+                    deleter.add([obj.key for obj in objects] + manifest_keys)
+                    deleter.close()
+                    timer.objects = deleter.count
+        finally:
+            with self.__deleters_lock:
+                self.__deleters.pop(session_id, None)
+
+        if state is not None:
+            state.remove()
+
+    def __release(self, session_id: str, keys: List[str]) -> None:
+        with self.__deleters_lock:
+            deleter = self.__deleters.get(session_id)
+        if deleter is not None:
+            deleter.add(keys)
+
+    def __resume_session(self, state_file: str, fingerprint: str) -> Optional[SessionState]:
+        state = SessionState.load(state_file)
+        if state is None:
+            return None
+        if state.fingerprint != fingerprint:
+            logger.debug("Session state %s belongs to another unload, start over", state_file)
+            return None
+
+        listed = {obj.key: obj for path in state.s3_paths for obj in self.__s3.list_objects(path.lstrip('/'))}
+        objects = []
+        for obj in state.objects:
+            current = listed.get(obj.key)
+            if current is None or current.size != obj.size or obj.etag not in ('', current.etag):
+                logger.debug("Object %s of session %s has changed, start over", obj.key, state.session_id)
+                return None
+            objects.append(current._replace(record_count=obj.record_count))
+
+        state.objects = objects
+        return state
+
+    def __download_objects(self, query: str, manifest: bool, merge: Callable[[str], None], **options: Any) -> None:
+        with self.__unload_session(query, manifest, **options) as (session_id, objects, _, _):
+            local_path = self.__generate_path(tempfile.gettempdir(), session_id)
+            local_files = [os.path.join(local_path, f'{i:06d}_{os.path.basename(obj.key)}')
+                           for i, obj in enumerate(objects)]
+
+            logger.debug("Create temporary directory: %s", local_path)
+            os.mkdir(local_path, 0o700)
+
+            logger.debug("Download and merge all objects with %s worker(s), up to %s in flight",
+                         self.__concurrency, self.__max_in_flight)
+            with self.__metrics.measure(session_id, metrics.DOWNLOAD) as timer:
+                timer.objects = len(objects)
+                timer.bytes = sum(obj.size for obj in objects)
+                self.__download_and_merge(session_id, [obj.key for obj in objects], local_files,
+                                          [obj.size for obj in objects], merge)
+
+            logger.debug("Remove temporary directory in local")
+            shutil.rmtree(local_path)
+
+    def __download_into(self, session_id: str, objects: List[S3Object], filename: str, header: bytes,
+                        state: Optional[SessionState] = None, base: int = 0) -> None:
+        offsets = list(itertools.accumulate([base + len(header)] + [obj.size for obj in objects]))
+
+        resumed = state is not None and state.completed and os.path.isfile(filename) \
+            and os.path.getsize(filename) == offsets[-1]
+        if state is not None and state.completed and not resumed:
+            logger.debug("%s does not match the session, download everything again", filename)
+            state.reset()
+
+        logger.debug("Preallocate %s bytes for %s", offsets[-1], filename)
+        with open(filename, 'r+b' if resumed or base > 0 else 'wb') as out:
+            try:
+                out.seek(base)
+                out.write(header)
+                out.flush()
+                output.preallocate(out.fileno(), offsets[-1])
+
+                pending = [i for i in sorted(range(len(objects)), key=lambda i: -objects[i].size)
+                           if not (resumed and state.is_completed(objects[i]))]
+                logger.debug("Download %s of %s object(s) into place with %s worker(s)",
+                             len(pending), len(objects), self.__concurrency)
+                with self.__metrics.measure(session_id, metrics.DOWNLOAD) as timer, \
+                        metrics.ContextThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+                    timer.objects = len(pending)
+                    timer.bytes = sum(objects[i].size for i in pending)
+                    futures = {executor.submit(self.__s3.download_into, key=objects[i].key, fd=out.fileno(),
+                                               offset=offsets[i], size=objects[i].size): objects[i]
+                               for i in pending}
+                    try:
+                        for future in concurrent.futures.as_completed(futures):
+                            future.result()
+                            if state is not None:
+                                state.complete(futures[future])
+                            self.__release(session_id, [futures[future].key])
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+            except BaseException:
+                if base > 0:
+                    logger.debug("Truncate %s back to %s bytes", filename, base)
+                    out.truncate(base)
+                raise
+
+    def __download_files(self, session_id: str, directory: str, header: bytes,
+                         layout: List[Tuple[str, List[S3Object]]]) -> None:
+        with self.__metrics.measure(session_id, metrics.DOWNLOAD) as timer, \
+                metrics.ContextThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            timer.objects = sum(len(objects) for _, objects in layout)
+            timer.bytes = sum(obj.size for _, objects in layout for obj in objects)
+
+            futures: Dict[concurrent.futures.Future, str] = {}
+            try:
+                for path, objects in layout:
+                    filename = os.path.join(directory, *path.split('/'))
+                    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+                    offsets = list(itertools.accumulate([len(header)] + [obj.size for obj in objects]))
+                    with open(filename, 'wb') as out:
+                        out.write(header)
+                        out.flush()
+                        output.preallocate(out.fileno(), offsets[-1])
+
+                    futures.update((executor.submit(self.__download_at, filename, obj, offset), obj.key)
+                                   for obj, offset in zip(objects, offsets))
+
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+                    self.__release(session_id, [futures[future]])
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def __download_at(self, filename: str, obj: S3Object, offset: int) -> None:
+        fd = os.open(filename, os.O_WRONLY)
+        try:
+            self.__s3.download_into(key=obj.key, fd=fd, offset=offset, size=obj.size)
+        finally:
+            os.close(fd)
+
+    def __concatenate(self, session_id: str, objects: List[S3Object], key: str, header: bytes) -> None:
+        logger.debug("Concatenate all objects into %s", key)
+        with self.__metrics.measure(session_id, metrics.MERGE) as timer:
+            timer.objects = len(objects)
+            timer.bytes = sum(obj.size for obj in objects)
+            self.__s3.concatenate(objects, key, gzip.compress(header) if header else b'', self.__concurrency)
+
+    def __write_file(self, session_id: str, objects: List[S3Object], filename: str, header: bytes,
+                     state: Optional[SessionState], codec: str) -> None:
+        if codec == compression.GZIP:
+            self.__download_into(session_id, objects, filename, gzip.compress(header) if header else b'', state)
+            return
 
-        logger.debug("Unload")
-        self.__redshift.unload(
-            query,
-            self.__s3.uri(s3_path),
-            gzip=True,
-            parallel=True,
-            delimiter=delimiter,
-            null_string=null_string,
-            add_quotes=add_quotes,
-            escape=escape,
-            allow_overwrite=True)
-
-        logger.debug("Fetch the list of objects")
-        s3_keys = self.__s3.list(s3_path.lstrip('/'))
-        local_files = list(map(lambda key: os.path.join(local_path, os.path.basename(key)), s3_keys))
-
-        logger.debug("Create temporary directory: %s", local_path)
-        os.mkdir(local_path, 0o700)
-
-        logger.debug("Download all objects")
-        for s3_key, local_file in zip(s3_keys, local_files):
-            self.__s3.download(key=s3_key, filename=local_file)
-
-        logger.debug("Merge all objects")
         with open(filename, 'wb') as out:
-            if columns is not None:
-                out.write(gzip.compress((delimiter.join(columns) + os.linesep).encode()))
+            self.__stream_into(session_id, objects, out, header, codec)
+
+    def __stream_into(self, session_id: str, objects: List[S3Object], fileobj: BinaryIO, header: bytes,
+                      codec: str) -> None:
+        with self.__metrics.measure(session_id, metrics.DOWNLOAD) as timer, \
+                contextlib.closing(self.__read_parts(session_id, objects)) as parts:
+            timer.objects = len(objects)
+            timer.bytes = sum(obj.size for obj in objects)
+
+            if codec == compression.GZIP:
+                output.write_all(fileobj, gzip.compress(header) if header else b'')
+                for data in parts:
+                    output.write_all(fileobj, data)
+                fileobj.flush()
+                return
+
+            logger.debug("Decompress and encode as %s", codec)
+            with compression.open_encoder(codec, fileobj, self.__concurrency) as encoder:
+                encoder.write(header)
+                for data in compression.decompress(parts):
+                    encoder.write(data)
+
+    def __read_objects(self, session_id: str, objects: List[S3Object]) -> Iterator[bytes]:
+        with contextlib.closing(self.__read_parts(session_id, objects)) as parts:
+            for obj in objects:
+                yield b''.join(itertools.islice(parts, math.ceil(obj.size / self.__part_size)))
+
+    def __read_parts(self, session_id: str, objects: List[S3Object]) -> Iterator[bytes]:
+        parts = [(obj.key, start, min(start + self.__part_size, obj.size), start + self.__part_size >= obj.size)
+                 for obj in objects for start in range(0, obj.size, self.__part_size)]
+
+        logger.debug("Stream %s part(s) of %s object(s) with %s worker(s), up to %s in flight",
+                     len(parts), len(objects), self.__concurrency, self.__max_in_flight)
+        with metrics.ContextThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            in_flight: Deque[Tuple[concurrent.futures.Future, str, bool]] = collections.deque()
+
+            def take() -> bytes:
+                future, key, last = in_flight.popleft()
+                data = future.result()
+                if last:
+                    self.__release(session_id, [key])
+                return data
 
-            for local_file in local_files:
-                logger.debug("Merge %s into result file", local_file)
+            try:
+                for key, start, end, last in parts:
+                    if len(in_flight) >= self.__max_in_flight:
+                        yield take()
+                    in_flight.append((executor.submit(self.__s3.read_range, key, start, end), key, last))
 
-                with open(local_file, 'rb') as read:
-                    shutil.copyfileobj(read, out, 2 * MB)
+                while in_flight:
+                    yield take()
+            except BaseException:
+                for future, _, _ in in_flight:
+                    future.cancel()
+                raise
 
+    def __unload_partitions(self, session_id: str, query: str, s3_path: str, manifest: bool, split_column: str,
+                            partitions: int, **options: Any) -> Tuple[List[str], List[S3Object], List[str]]:
+        logger.debug("Get the range of %s", split_column)
+        with self.__redshift_pool.acquire() as redshift, self.__metrics.measure(session_id, metrics.GET_RANGE):
+            lower, upper = redshift.get_range(query, split_column)
+
+        if lower is None:
+            logger.debug("No value of %s, unload without partitioning", split_column)
+            return ([s3_path],) + self.__unload_objects(session_id, query, s3_path, manifest, **options)
+
+        queries = self.__generate_range_queries(query, split_column, lower, upper, partitions)
+        s3_paths = [self.__generate_path(s3_path, f'{i:04d}', '/') for i in range(len(queries))]
+
+        logger.debug("Unload %s partition(s) over %s connection(s)", len(queries), self.__redshift_pool.size)
+        with metrics.ContextThreadPoolExecutor(max_workers=self.__redshift_pool.size) as executor:
+            futures = [executor.submit(self.__unload_objects, session_id, range_query, path, manifest, **options)
+                       for range_query, path in zip(queries, s3_paths)]
+            results = [future.result() for future in futures]
+
+        return s3_paths, [obj for objects, _ in results for obj in objects], results[0][1]
+
+    def __unload_objects(self, session_id: str, query: str, s3_path: str, manifest: bool,
+                         **options: Any) -> Tuple[List[S3Object], List[str]]:
+        self.__sweep_in_background()
+
+        logger.debug("Unload")
+        with self.__redshift_pool.acquire() as redshift:
+            layout = self.__plan_layout(redshift, query) if self.__auto_file_size else {}
+
+            with self.__metrics.measure(session_id, metrics.UNLOAD):
+                redshift.unload(
+                    query,
+                    self.__s3.uri(s3_path),
+                    manifest=manifest,
+                    verbose_manifest=manifest,
+                    allow_overwrite=True,
+                    **{**options, 'parallel': True, **layout})
+
+        with self.__metrics.measure(session_id, metrics.LIST) as timer:
+            if manifest:
+                manifest_key = s3_path.lstrip('/') + MANIFEST_NAME
+                logger.debug("Read the manifest: %s", manifest_key)
+                unloaded = self.__s3.read_manifest(manifest_key)
+                objects = [S3Object(key=entry.key, size=entry.content_length, etag='', record_count=entry.record_count)
+                           for entry in unloaded.entries]
+                columns = unloaded.columns
+            else:
+                logger.debug("Fetch the list of objects")
+                objects = self.__s3.list_objects(s3_path.lstrip('/'))
+                columns = []
+
+            timer.objects = len(objects)
+            timer.bytes = sum(obj.size for obj in objects)
+
+        return objects, columns
+
+    def __plan_layout(self, redshift: Redshift, query: str) -> Dict[str, Any]:
+        if self.__slice_count is None:
+            self.__slice_count = redshift.get_slice_count()
+
+        size = redshift.estimate_size(query)
+        parallel, max_file_size = self.__generate_layout(self.__slice_count, size, self.__concurrency)
+        logger.debug("Estimated %s byte(s) over %s slice(s): PARALLEL %s, MAXFILESIZE %s",
+                     size, self.__slice_count, 'ON' if parallel else 'OFF', max_file_size)
+
+        layout: Dict[str, Any] = {'parallel': parallel}
+        if max_file_size is not None:
+            layout['max_file_size'] = max_file_size
+        return layout
+
+    def __sweep_in_background(self) -> None:
+        if not self.__sweep_orphans:
+            return
+
+        with self.__deleters_lock:
+            if self.__sweeper is not None:
+                return
+            self.__sweeper = threading.Thread(target=self.__sweep_quietly, name='redshift-unloader-sweeper',
+                                              daemon=True)
+        self.__sweeper.start()
+
+    def __sweep_quietly(self) -> None:
+        try:
+            self.sweep()
+        except Exception as e:
+            logger.debug("Failed to sweep orphaned sessions: %s", e)
+
+    def __delete(self, session_id: str, keys: List[str]) -> None:
         logger.debug("Remove all objects in S3")
-        self.__s3.delete(s3_keys)
+        with self.__metrics.measure(session_id, metrics.DELETE) as timer:
+            timer.objects = len(keys)
+            self.__s3.delete(keys)
 
-        logger.debug("Remove temporary directory in local")
-        shutil.rmtree(local_path)
+    def __download_and_merge(self, session_id: str, s3_keys: List[str], local_files: List[str],
+                             sizes: Optional[List[int]], merge: Callable[[str], None]) -> None:
+        indices = range(len(s3_keys))
+        queue = collections.deque(sorted(indices, key=lambda i: -sizes[i]) if sizes is not None else indices)
+        in_flight: Dict[int, concurrent.futures.Future] = {}
+
+        with metrics.ContextThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            def submit(index: int) -> None:
+                in_flight[index] = executor.submit(self.__s3.download, key=s3_keys[index], filename=local_files[index],
+                                                   size=sizes[index] if sizes is not None else None)
+
+            try:
+                for cursor in indices:
+                    while queue and len(in_flight) < self.__max_in_flight:
+                        submit(queue.popleft())
+                    if cursor not in in_flight:
+                        queue.remove(cursor)
+                        submit(cursor)
+
+                    self.__merge(session_id, in_flight.pop(cursor), local_files[cursor],
+                                 sizes[cursor] if sizes is not None else 0, merge)
+                    self.__release(session_id, [s3_keys[cursor]])
+            except BaseException:
+                for future in in_flight.values():
+                    future.cancel()
+                raise
+
+    def __merge(self, session_id: str, future: concurrent.futures.Future, local_file: str, size: int,
+                merge: Callable[[str], None]) -> None:
+        future.result()
+
+        logger.debug("Merge %s into result file", local_file)
+        with self.__metrics.measure(session_id, metrics.MERGE) as timer:
+            timer.objects = 1
+            timer.bytes = size
+            merge(local_file)
+        os.remove(local_file)
+
+    @staticmethod
+    def __generate_range_queries(query: str, column: str, lower: Any, upper: Any, partitions: int) -> List[str]:
+        if isinstance(lower, int) and isinstance(upper, int):
+            partitions = max(1, min(partitions, upper - lower + 1))
+            bounds = [lower + (upper - lower + 1) * i // partitions for i in range(partitions)]
+        elif isinstance(lower, (int, float, decimal.Decimal)) and isinstance(upper, (int, float, decimal.Decimal)):
+            bounds = [lower + (upper - lower) * i / partitions for i in range(partitions)]
+        else:
+            raise ValueError(f"split_column must be numeric: {column} ranges from {lower!r} to {upper!r}")
+
+        queries = []
+        for i, bound in enumerate(bounds):
+            conditions = [f'{column} >= {bound}']
+            if i + 1 < len(bounds):
+                conditions.append(f'{column} < {bounds[i + 1]}')
+            else:
+                conditions.append(f'{column} <= {upper}')
+            condition = ' AND '.join(conditions)
+            if i + 1 == len(bounds):
+                condition = f'({condition}) OR {column} IS NULL'
+            queries.append(f'SELECT * FROM ({query}) AS query WHERE {condition}')
+
+        return queries
+
+    @staticmethod
+    def __generate_layout(slices: int, size: Optional[int], concurrency: int) -> Tuple[bool, Optional[str]]:
+        if size is None:
+            return True, None
+
+        compressed = size // COMPRESSION_RATIO
+        if compressed < MIN_FILE_SIZE:
+            return False, None
+
+        file_size = min(max(compressed // max(slices, concurrency), MIN_FILE_SIZE), MAX_FILE_SIZE)
+        return True, f'{math.ceil(file_size / MB)} MB'
+
+    @staticmethod
+    def __generate_incremental_query(query: str, column: str, lower: Any, upper: Any = None) -> str:
+        conditions = []
+        if lower is not None:
+            conditions.append(f'{column} > {watermark.literal(lower)}')
+        if upper is not None:
+            conditions.append(f'{column} <= {watermark.literal(upper)}')
+        if not conditions:
+            return query
+        return f'SELECT * FROM ({query}) AS query WHERE {" AND ".join(conditions)}'
+
+    @staticmethod
+    def __generate_roll_filename(filename: str, run: int) -> str:
+        directory, basename = os.path.split(filename)
+        name, dot, extension = basename.partition('.')
+        return os.path.join(directory, f'{name}.{run:06d}{dot}{extension}')
 
     @staticmethod
     def __generate_session_id() -> str:
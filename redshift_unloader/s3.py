@@ -1,44 +1,406 @@
-import boto3
-import boto3.resources
+import concurrent.futures
+import importlib.util
+import math
+import os
+import threading
 import urllib.parse
 
-from typing import List
+from typing import Any, BinaryIO, Callable, ContextManager, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
 from redshift_unloader.credential import Credential
+from redshift_unloader.manifest import Manifest
+from redshift_unloader.metrics import ContextThreadPoolExecutor, count_retries
+from redshift_unloader.output import pwrite_all
+from redshift_unloader.throttle import Throttle
 from redshift_unloader.logger import logger
 
 MAX_DELETE_OBJECTS = 1000
+DEFAULT_DELETE_CONCURRENCY = 4
+MAX_REPORTED_ERRORS = 10
+MAX_ATTEMPTS = 10
+THROTTLE_CODES = ('SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequests',
+                  'RequestThrottled')
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_PART_CONCURRENCY = 4
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+MAX_PARTS = 10000
 
 
-class S3:
-    __session: boto3.session.Session
-    __s3: 'boto3.resources.factory.s3.ServiceResource'
-    __bucket: 'boto3.resources.factory.s3.Bucket'
+class S3Object(NamedTuple):
+    key: str
+    size: int
+    etag: str
+    record_count: Optional[int] = None
+
+
+class PartSource(NamedTuple):
+    key: str
+    start: int
+    end: int
+
 
-    def __init__(self, credential: Credential, bucket: str, region: str) -> None:
-        self.__session = boto3.session.Session(
+class SharedClient:
+    __client: 'botocore.client.S3'
+    __throttle: Throttle
+    __retries: int
+    __lock: threading.Lock
+
+    def __init__(self, credential: Credential, region: str, max_pool_connections: int) -> None:
+        import boto3
+        import botocore.config
+
+        options: Dict[str, Any] = {'max_pool_connections': max_pool_connections}
+        if 'tcp_keepalive' in botocore.config.Config.OPTION_DEFAULTS:
+            options['tcp_keepalive'] = True
+        if importlib.util.find_spec('botocore.retries') is not None:
+            options['retries'] = {'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS}
+
+        session = boto3.session.Session(
             aws_access_key_id=credential.access_key_id,
             aws_secret_access_key=credential.secret_access_key,
             region_name=region
         )
-        self.__s3 = self.__session.resource('s3')
-        self.__bucket = self.__s3.Bucket(bucket)
+        self.__client = session.client('s3', config=botocore.config.Config(**options))
+        self.__throttle = Throttle(max_pool_connections)
+        self.__retries = 0
+        self.__lock = threading.Lock()
+        self.__client.meta.events.register('after-call.s3', self.__count_retries)
+        self.__client.meta.events.register('needs-retry.s3', self.__check_throttle)
+
+    @property
+    def client(self) -> 'botocore.client.S3':
+        return self.__client
+
+    @property
+    def throttle(self) -> Throttle:
+        return self.__throttle
+
+    @property
+    def retries(self) -> int:
+        return self.__retries
+
+    def __count_retries(self, parsed: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            with self.__lock:
+                self.__retries += retries
+            count_retries(retries)
+
+    def __check_throttle(self, response: Optional[Tuple[Any, Dict[str, Any]]] = None, **kwargs: Any) -> None:
+        if response is None:
+            return
+
+        http_response, parsed = response
+        if http_response.status_code == 503 or parsed.get('Error', {}).get('Code') in THROTTLE_CODES:
+            self.__throttle.throttled()
+        elif http_response.status_code < 400:
+            self.__throttle.succeeded()
+
+
+_clients: Dict[Tuple[int, Credential, str, int], SharedClient] = {}
+_clients_lock = threading.Lock()
+
+
+class BatchDeleter:
+    __delete: Callable[[List[str]], None]
+    __executor: Optional[concurrent.futures.ThreadPoolExecutor]
+    __futures: List[concurrent.futures.Future]
+    __pending: List[str]
+    __added: Set[str]
+    __lock: threading.Lock
+
+    def __init__(self, delete: Callable[[List[str]], None], concurrency: int = DEFAULT_DELETE_CONCURRENCY) -> None:
+        self.__delete = delete
+        self.__executor = ContextThreadPoolExecutor(max_workers=concurrency)
+        self.__futures = []
+        self.__pending = []
+        self.__added = set()
+        self.__lock = threading.Lock()
+
+    def __enter__(self) -> 'BatchDeleter':
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def count(self) -> int:
+        return len(self.__added)
+
+    def add(self, keys: Iterable[str]) -> None:
+        with self.__lock:
+            for key in keys:
+                if key not in self.__added:
+                    self.__added.add(key)
+                    self.__pending.append(key)
+
+            while len(self.__pending) >= MAX_DELETE_OBJECTS:
+                self.__submit(MAX_DELETE_OBJECTS)
+            if self.__pending and all(future.done() for future in self.__futures):
+                self.__submit(len(self.__pending))
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__executor is None:
+                return
+            if self.__pending:
+                self.__submit(len(self.__pending))
+            futures, self.__futures = self.__futures, []
+
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        with self.__lock:
+            if self.__executor is None:
+                return
+            executor, self.__executor = self.__executor, None
+            self.__pending = []
+
+        executor.shutdown(wait=True)
+
+    def __submit(self, size: int) -> None:
+        batch, self.__pending = self.__pending[:size], self.__pending[size:]
+        logger.debug("Remove a batch of %s object(s) in the background", len(batch))
+        self.__futures.append(self.__executor.submit(self.__delete, batch))
+
+
+def shared_client(credential: Credential, region: str, max_pool_connections: int) -> SharedClient:
+    key = (os.getpid(), credential, region, max_pool_connections)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.debug("Create S3 client for %s", region)
+            client = _clients[key] = SharedClient(credential, region, max_pool_connections)
+        return client
+
+
+class S3:
+    __credential: Credential
+    __region: str
+    __bucket: str
+    __max_pool_connections: int
+    __part_size: int
+    __part_concurrency: int
+    __shared: Optional[SharedClient]
+    __pid: Optional[int]
+    __lock: threading.Lock
+
+    def __init__(self, credential: Credential, bucket: str, region: str,
+                 max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+                 part_size: int = DEFAULT_PART_SIZE, part_concurrency: int = DEFAULT_PART_CONCURRENCY) -> None:
+        self.__credential = credential
+        self.__region = region
+        self.__bucket = bucket
+        self.__max_pool_connections = max_pool_connections
+        self.__part_size = part_size
+        self.__part_concurrency = part_concurrency
+        self.__shared = None
+        self.__pid = None
+        self.__lock = threading.Lock()
 
     def __del__(self) -> None:
         pass
 
+    @property
+    def retries(self) -> int:
+        return self.__shared.retries if self.__shared is not None else 0
+
     def uri(self, path: str) -> str:
-        return urllib.parse.urlunparse(['s3', self.__bucket.name, path, None, None, None])
+        return urllib.parse.urlunparse(['s3', self.__bucket, path, None, None, None])
 
     def list(self, path: str) -> List[str]:
-        return [obj.key for obj in self.__bucket.objects.filter(Prefix=path)]
+        return [obj.key for obj in self.list_objects(path)]
+
+    def list_objects(self, path: str) -> List[S3Object]:
+        return [S3Object(key=content['Key'], size=content['Size'], etag=content['ETag'])
+                for content in self.__list_contents(path)]
+
+    def list_modified(self, path: str) -> List[Tuple[str, float]]:
+        return [(content['Key'], content['LastModified'].timestamp()) for content in self.__list_contents(path)]
+
+    def open(self, key: str) -> BinaryIO:
+        logger.debug("Open %s", key)
+        with self.__slot():
+            return self.__client.get_object(Bucket=self.__bucket, Key=key)['Body']
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        logger.debug("Read bytes %s-%s of %s", start, end - 1, key)
+        with self.__slot():
+            response = self.__client.get_object(Bucket=self.__bucket, Key=key, Range=f'bytes={start}-{end - 1}')
+            data = response['Body'].read()
+
+        if len(data) != end - start:
+            raise IOError(f"Read {len(data)} bytes of {key} at {start}, expected {end - start} bytes")
+        return data
 
-    def delete(self, keys: List[str]) -> None:
+    def read_manifest(self, key: str) -> Manifest:
+        logger.debug("Read manifest %s", key)
+        with self.__slot():
+            response = self.__client.get_object(Bucket=self.__bucket, Key=key)
+            return Manifest.from_json(response['Body'].read().decode())
+
+    def delete(self, keys: List[str], concurrency: int = DEFAULT_DELETE_CONCURRENCY) -> None:
         logger.debug("Remove %s object(s) from S3", len(keys))
-        for i in range(0, len(keys), MAX_DELETE_OBJECTS):
-            sliced_keys = keys[i:i + MAX_DELETE_OBJECTS]
-            self.__bucket.delete_objects(Delete={'Objects': [{'Key': key} for key in sliced_keys]})
+        batches = [keys[i:i + MAX_DELETE_OBJECTS] for i in range(0, len(keys), MAX_DELETE_OBJECTS)]
+        with ContextThreadPoolExecutor(max_workers=concurrency) as executor:
+            errors = [error for errors in executor.map(self.__delete_batch, batches) for error in errors]
+
+        if errors:
+            raise IOError(f"Failed to remove {len(errors)} object(s) from S3: " +
+                          ', '.join(f"{error.get('Key')} ({error.get('Code')})"
+                                    for error in errors[:MAX_REPORTED_ERRORS]))
 
-    def download(self, key: str, filename: str) -> None:
+    def download(self, key: str, filename: str, size: Optional[int] = None) -> None:
         logger.debug("Download %s to %s", key, filename)
-        self.__bucket.download_file(Key=key, Filename=filename)
+        if size is None:
+            size = self.__size(key)
+
+        with open(filename, 'wb') as f:
+            f.truncate(size)
+            self.__download_parts(key, f.fileno(), 0, size)
+
+    def download_into(self, key: str, fd: int, offset: int, size: int) -> None:
+        logger.debug("Download %s into offset %s", key, offset)
+        self.__download_parts(key, fd, offset, size)
+
+    def concatenate(self, objects: List[S3Object], key: str, header: bytes = b'', concurrency: int = 1) -> None:
+        parts = self.plan_parts(objects, len(header))
+        if not parts:
+            logger.debug("Put empty object %s", key)
+            with self.__slot():
+                self.__client.put_object(Bucket=self.__bucket, Key=key, Body=b'')
+            return
+
+        upload_id = self.__client.create_multipart_upload(Bucket=self.__bucket, Key=key)['UploadId']
+        logger.debug("Concatenate %s object(s) into %s with %s part(s)", len(objects), key, len(parts))
+        try:
+            with ContextThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(self.__upload_part, key, upload_id, number, sources,
+                                           header if number == 1 else b'')
+                           for number, sources in enumerate(parts, 1)]
+                etags = [future.result() for future in futures]
+
+            self.__client.complete_multipart_upload(
+                Bucket=self.__bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': [{'ETag': etag, 'PartNumber': number}
+                                           for number, etag in enumerate(etags, 1)]})
+        except BaseException:
+            logger.debug("Abort multipart upload of %s", key)
+            self.__client.abort_multipart_upload(Bucket=self.__bucket, Key=key, UploadId=upload_id)
+            raise
+
+    @staticmethod
+    def plan_parts(objects: List[S3Object], header_size: int = 0) -> List[List[PartSource]]:
+        objects = [obj for obj in objects if obj.size > 0]
+        min_part_size = max(MIN_PART_SIZE, math.ceil((header_size + sum(obj.size for obj in objects)) / MAX_PARTS))
+        parts: List[List[PartSource]] = []
+        buffered: List[PartSource] = []
+        buffered_size = header_size
+
+        for obj in objects:
+            start = 0
+            if buffered_size > 0 or obj.size < min_part_size:
+                needed = min_part_size - buffered_size
+                if obj.size - needed < min_part_size:
+                    buffered.append(PartSource(key=obj.key, start=0, end=obj.size))
+                    buffered_size += obj.size
+                    if buffered_size >= min_part_size:
+                        parts.append(buffered)
+                        buffered, buffered_size = [], 0
+                    continue
+
+                buffered.append(PartSource(key=obj.key, start=0, end=needed))
+                parts.append(buffered)
+                buffered, buffered_size = [], 0
+                start = needed
+
+            count = math.ceil((obj.size - start) / MAX_PART_SIZE)
+            bounds = [start + (obj.size - start) * i // count for i in range(count + 1)]
+            parts.extend([PartSource(key=obj.key, start=lower, end=upper)] for lower, upper in zip(bounds, bounds[1:]))
+
+        if buffered or buffered_size > 0:
+            parts.append(buffered)
+        if len(parts) > MAX_PARTS:
+            raise ValueError(f"Too many parts to concatenate: {len(parts)}")
+
+        return parts
+
+    def __upload_part(self, key: str, upload_id: str, number: int, sources: List[PartSource], header: bytes) -> str:
+        if not header and len(sources) == 1:
+            source = sources[0]
+            logger.debug("Copy bytes %s-%s of %s into part %s", source.start, source.end - 1, source.key, number)
+            with self.__slot():
+                response = self.__client.upload_part_copy(
+                    Bucket=self.__bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                    CopySource={'Bucket': self.__bucket, 'Key': source.key},
+                    CopySourceRange=f'bytes={source.start}-{source.end - 1}')
+            return response['CopyPartResult']['ETag']
+
+        logger.debug("Upload %s source(s) into part %s", len(sources), number)
+        body = header + b''.join(self.read_range(source.key, source.start, source.end)
+                                 for source in sources if source.end > source.start)
+        with self.__slot():
+            return self.__client.upload_part(Bucket=self.__bucket, Key=key, UploadId=upload_id,
+                                             PartNumber=number, Body=body)['ETag']
+
+    def __size(self, key: str) -> int:
+        with self.__slot():
+            return self.__client.head_object(Bucket=self.__bucket, Key=key)['ContentLength']
+
+    def __download_parts(self, key: str, fd: int, offset: int, size: int) -> None:
+        def download_part(start: int, end: int) -> None:
+            pwrite_all(fd, self.read_range(key, start, end), offset + start)
+
+        ranges = [(start, min(start + self.__part_size, size)) for start in range(0, size, self.__part_size)]
+        if len(ranges) <= 1:
+            for start, end in ranges:
+                download_part(start, end)
+            return
+
+        with ContextThreadPoolExecutor(max_workers=min(self.__part_concurrency, len(ranges))) as executor:
+            futures = [executor.submit(download_part, start, end) for start, end in ranges]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def __list_contents(self, path: str) -> List[Dict[str, Any]]:
+        paginator = self.__client.get_paginator('list_objects_v2')
+        with self.__slot():
+            return [content for page in paginator.paginate(Bucket=self.__bucket, Prefix=path)
+                    for content in page.get('Contents', [])]
+
+    def __delete_batch(self, keys: List[str]) -> List[Dict[str, str]]:
+        with self.__slot():
+            response = self.__client.delete_objects(Bucket=self.__bucket,
+                                                    Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        errors = response.get('Errors', [])
+        for error in errors:
+            logger.debug("Failed to remove %s: %s %s", error.get('Key'), error.get('Code'), error.get('Message'))
+        return errors
+
+    def __slot(self) -> ContextManager[None]:
+        return self.__connect().throttle.slot()
+
+    @property
+    def __client(self) -> 'botocore.client.S3':
+        return self.__connect().client
+
+    def __connect(self) -> SharedClient:
+        with self.__lock:
+            if self.__shared is None or self.__pid != os.getpid():
+                self.__shared = shared_client(self.__credential, self.__region, self.__max_pool_connections)
+                self.__pid = os.getpid()
+            return self.__shared
@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+
+from typing import Dict, List, Optional
+
+from redshift_unloader.logger import logger
+from redshift_unloader.s3 import S3Object
+
+
+class SessionState:
+    __path: str
+    __lock: threading.Lock
+
+    session_id: str
+    fingerprint: str
+    s3_paths: List[str]
+    objects: List[S3Object]
+    columns: List[str]
+    completed: Dict[str, str]
+
+    def __init__(self, path: str, session_id: str, fingerprint: str,
+                 s3_paths: List[str], objects: List[S3Object], columns: Optional[List[str]] = None,
+                 completed: Optional[Dict[str, str]] = None) -> None:
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.session_id = session_id
+        self.fingerprint = fingerprint
+        self.s3_paths = s3_paths
+        self.objects = objects
+        self.columns = columns if columns is not None else []
+        self.completed = completed if completed is not None else {}
+
+    @classmethod
+    def load(cls, path: str) -> Optional['SessionState']:
+        try:
+            with open(path, 'r') as f:
+                document = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.debug("Ignore broken session state %s: %s", path, e)
+            return None
+
+        return cls(path=path,
+                   session_id=document['session_id'],
+                   fingerprint=document['fingerprint'],
+                   s3_paths=document['s3_paths'],
+                   objects=[S3Object(*obj) for obj in document['objects']],
+                   columns=document.get('columns'),
+                   completed=document['completed'])
+
+    def is_completed(self, obj: S3Object) -> bool:
+        etag = self.completed.get(obj.key)
+        return etag is not None and etag in ('', obj.etag)
+
+    def complete(self, obj: S3Object) -> None:
+        with self.__lock:
+            self.completed[obj.key] = obj.etag
+            self.save()
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.completed = {}
+            self.save()
+
+    def save(self) -> None:
+        document = {
+            'session_id': self.session_id,
+            'fingerprint': self.fingerprint,
+            's3_paths': self.s3_paths,
+            'objects': [list(obj) for obj in self.objects],
+            'columns': self.columns,
+            'completed': self.completed
+        }
+
+        temp_path = f'{self.__path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(temp_path, self.__path)
+
+    def remove(self) -> None:
+        logger.debug("Remove session state %s", self.__path)
+        try:
+            os.remove(self.__path)
+        except FileNotFoundError:
+            pass
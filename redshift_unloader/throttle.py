@@ -0,0 +1,71 @@
+import contextlib
+import threading
+import time
+
+from typing import Iterator
+
+from redshift_unloader.logger import logger
+
+DEFAULT_COOLDOWN = 1.0
+
+
+class Throttle:
+    __maximum: int
+    __minimum: int
+    __cooldown: float
+    __limit: float
+    __active: int
+    __decreased: float
+    __condition: threading.Condition
+
+    def __init__(self, maximum: int, minimum: int = 1, cooldown: float = DEFAULT_COOLDOWN) -> None:
+        if minimum < 1:
+            raise ValueError(f"minimum must be positive: {minimum}")
+        if maximum < minimum:
+            raise ValueError(f"maximum must not be less than minimum: {maximum}")
+
+        self.__maximum = maximum
+        self.__minimum = minimum
+        self.__cooldown = cooldown
+        self.__limit = float(maximum)
+        self.__active = 0
+        self.__decreased = float('-inf')
+        self.__condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self.__limit)
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        with self.__condition:
+            while self.__active >= int(self.__limit):
+                self.__condition.wait()
+            self.__active += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__active -= 1
+                self.__condition.notify()
+
+    def throttled(self) -> None:
+        with self.__condition:
+            now = time.monotonic()
+            if now - self.__decreased < self.__cooldown:
+                return
+
+            self.__decreased = now
+            self.__limit = max(float(self.__minimum), self.__limit / 2)
+            logger.debug("Throttled, lower the concurrency limit to %s", int(self.__limit))
+
+    def succeeded(self) -> None:
+        with self.__condition:
+            if self.__limit >= self.__maximum:
+                return
+
+            limit = int(self.__limit)
+            self.__limit = min(float(self.__maximum), self.__limit + 1 / self.__limit)
+            if int(self.__limit) > limit:
+                logger.debug("Raise the concurrency limit to %s", int(self.__limit))
+                self.__condition.notify_all()
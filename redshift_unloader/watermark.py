@@ -0,0 +1,121 @@
+import abc
+import contextlib
+import datetime
+import decimal
+import json
+import os
+import threading
+
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from redshift_unloader.logger import logger
+
+APPEND = 'append'
+ROLL = 'roll'
+LOCK_SUFFIX = '.lock'
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class Watermark(NamedTuple):
+    value: Any
+    run: int
+
+
+def literal(value: Any) -> str:
+    if isinstance(value, bool):
+        raise ValueError(f"watermark must be a number, a date, a timestamp or a string: {value!r}")
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return f"'{value.isoformat(sep=' ')}'"
+    if isinstance(value, datetime.date):
+        return f"'{value.isoformat()}'"
+    if isinstance(value, str):
+        return "'{}'".format(value.replace("'", "''"))
+    raise ValueError(f"watermark must be a number, a date, a timestamp or a string: {value!r}")
+
+
+def encode(value: Any) -> Dict[str, str]:
+    literal(value)
+    if isinstance(value, datetime.datetime):
+        return {'type': 'datetime', 'value': value.strftime(DATETIME_FORMAT + '%z')}
+    if isinstance(value, datetime.date):
+        return {'type': 'date', 'value': value.strftime(DATE_FORMAT)}
+    return {'type': type(value).__name__.lower(), 'value': str(value)}
+
+
+def decode(document: Dict[str, str]) -> Any:
+    parsers = {
+        'int': int,
+        'float': float,
+        'decimal': decimal.Decimal,
+        'str': str,
+        'date': lambda value: datetime.datetime.strptime(value, DATE_FORMAT).date(),
+        'datetime': lambda value: datetime.datetime.strptime(
+            value, DATETIME_FORMAT + '%z' if len(value) > len('YYYY-mm-ddTHH:MM:SS.ffffff') else DATETIME_FORMAT),
+    }
+    return parsers[document['type']](document['value'])
+
+
+class WatermarkStore(abc.ABC):
+    @abc.abstractmethod
+    def load(self, key: str) -> Optional[Watermark]:
+        pass
+
+    @abc.abstractmethod
+    def save(self, key: str, watermark: Watermark) -> None:
+        pass
+
+
+class FileWatermarkStore(WatermarkStore):
+    __path: str
+    __lock: threading.Lock
+
+    def __init__(self, path: str) -> None:
+        self.__path = path
+        self.__lock = threading.Lock()
+
+    def load(self, key: str) -> Optional[Watermark]:
+        document = self.__read().get(key)
+        if document is None:
+            return None
+
+        return Watermark(value=decode(document['watermark']), run=document['run'])
+
+    def save(self, key: str, watermark: Watermark) -> None:
+        with self.__lock, self.__file_lock():
+            documents = self.__read()
+            documents[key] = {'watermark': encode(watermark.value), 'run': watermark.run}
+
+            temp_path = f'{self.__path}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(documents, f, sort_keys=True)
+            os.replace(temp_path, self.__path)
+
+        logger.debug("Advance the watermark of %s to %s", key, watermark.value)
+
+    def __read(self) -> Dict[str, Any]:
+        try:
+            with open(self.__path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @contextlib.contextmanager
+    def __file_lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.__path + LOCK_SUFFIX, 'w') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
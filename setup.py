@@ -20,6 +20,11 @@ setup(
     license='MIT License',
     packages=find_packages(exclude=('tests', 'docs')),
     install_requires=requirements,
+    extras_require={
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+        'pandas': ['pandas'],
+    },
     tests_require=test_requirements,
     python_requires='>=3.6',
     classifiers=[
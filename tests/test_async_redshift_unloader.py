@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import unittest
+
+from unittest import mock
+
+from redshift_unloader import AsyncRedshiftUnloader, UnloadJob
+
+
+class TestAsyncRedshiftUnloader(unittest.TestCase):
+    HOST = 'test.redshift.com'
+    PORT = 5439
+    USER = 'user'
+    PASSWORD = 'password'
+    DATABASE = 'database'
+    S3_BUCKET = 'test_bucket'
+    REGION = 'ap-northeast-1'
+    ACCESS_KEY_ID = 'test_access_key'
+    SECRET_ACCESS_KEY = 'test_secret_key'
+
+    def setUp(self):
+        unloader_patcher = mock.patch('redshift_unloader.async_redshift_unloader.RedshiftUnloader')
+        s3_patcher = mock.patch('redshift_unloader.async_redshift_unloader.S3')
+        self.unloader = unloader_patcher.start().return_value
+        self.s3 = s3_patcher.start().return_value
+        self.addCleanup(unloader_patcher.stop)
+        self.addCleanup(s3_patcher.stop)
+
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+        self.async_unloader = AsyncRedshiftUnloader(host=self.HOST, port=self.PORT, user=self.USER,
+                                                    password=self.PASSWORD, database=self.DATABASE,
+                                                    s3_bucket=self.S3_BUCKET, access_key_id=self.ACCESS_KEY_ID,
+                                                    secret_access_key=self.SECRET_ACCESS_KEY, region=self.REGION)
+        self.addCleanup(self.async_unloader.close)
+
+    def tearDown(self):
+        pass
+
+    def test_unload(self):
+        self.loop.run_until_complete(self.async_unloader.unload('some_query', '/path/to/output', delimiter='|'))
+
+        self.unloader.unload.assert_called_once_with('some_query', '/path/to/output', delimiter='|',
+                                                     add_quotes=True, escape=True, null_string='',
+                                                     with_header=True, manifest=False, resume=False,
+                                                     codec='gzip')
+
+    def test_exit_without_blocking_loop(self):
+        release = threading.Event()
+        released = []
+        self.unloader.unload.side_effect = lambda *args, **kwargs: released.append(release.wait(5))
+
+        async def release_later():
+            await asyncio.sleep(0.05)
+            release.set()
+
+        async def run():
+            async with self.async_unloader as unloader:
+                task = asyncio.ensure_future(unloader.unload('some_query', '/path/to/output'))
+                releaser = asyncio.ensure_future(release_later())
+                await asyncio.sleep(0)
+            await asyncio.gather(task, releaser)
+
+        self.loop.run_until_complete(run())
+        self.assertListEqual(released, [True])
+
+    def test_unload_fileobj(self):
+        fileobj = mock.Mock()
+        self.loop.run_until_complete(self.async_unloader.unload_fileobj('some_query', fileobj, manifest=True))
+
+        self.unloader.unload_fileobj.assert_called_once_with('some_query', fileobj, delimiter=',',
+                                                             add_quotes=True, escape=True, null_string='',
+                                                             with_header=True, manifest=True, codec='gzip')
+
+    def test_unload_many(self):
+        error = RuntimeError('query2 failed')
+        self.unloader.unload.side_effect = [None, error]
+        jobs = [UnloadJob('query1', '/path/to/output1'), UnloadJob('query2', '/path/to/output2')]
+
+        results = self.loop.run_until_complete(self.async_unloader.unload_many(jobs))
+
+        self.assertListEqual([result.job for result in results], jobs)
+        self.assertIn(error, [result.error for result in results])
+        self.assertEqual(sum(result.succeeded for result in results), 1)
+
+    def test_s3_operations(self):
+        self.s3.list.return_value = ['path/to/object1']
+
+        self.assertListEqual(self.loop.run_until_complete(self.async_unloader.list('path/to/')),
+                             ['path/to/object1'])
+        self.loop.run_until_complete(self.async_unloader.download('path/to/object1', '/path/to/output'))
+        self.loop.run_until_complete(self.async_unloader.delete(['path/to/object1']))
+
+        self.s3.list.assert_called_once_with('path/to/')
+        self.s3.download.assert_called_once_with(key='path/to/object1', filename='/path/to/output')
+        self.s3.delete.assert_called_once_with(['path/to/object1'])
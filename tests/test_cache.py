@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from redshift_unloader.cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.cache = ResultCache(self.cache_dir, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, body):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(body)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_key(self):
+        options = {'delimiter': ','}
+
+        self.assertEqual(ResultCache.key("SELECT *\n  FROM t WHERE a = 'x';", options),
+                         ResultCache.key("  SELECT * FROM t   WHERE a = 'x'", options))
+        self.assertNotEqual(ResultCache.key("SELECT * FROM t WHERE a = 'x  y'", options),
+                            ResultCache.key("SELECT * FROM t WHERE a = 'x y'", options))
+        self.assertNotEqual(ResultCache.key("SELECT * FROM t", options),
+                            ResultCache.key("SELECT * FROM t", {'delimiter': '|'}))
+
+    def test_get_and_put(self):
+        output = os.path.join(self.temp_dir, 'output')
+
+        self.assertFalse(self.cache.get('key', output))
+        self.assertFalse(os.path.exists(output))
+
+        self.cache.put('key', self.write('result', b'result'))
+
+        self.assertTrue(self.cache.get('key', output))
+        self.assertEqual(self.read(output), b'result')
+
+    def test_ttl(self):
+        output = os.path.join(self.temp_dir, 'output')
+        self.cache.put('key', self.write('result', b'result'))
+
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertFalse(self.cache.get('key', output))
+            self.cache.evict()
+
+        self.assertListEqual([name for name in os.listdir(self.cache_dir) if name.endswith('.cache')], [])
+
+    def test_lru_eviction(self):
+        cache = ResultCache(self.cache_dir, ttl=60, max_bytes=10)
+        output = os.path.join(self.temp_dir, 'output')
+
+        cache.put('old', self.write('old', b'12345'))
+        cache.put('new', self.write('new', b'12345'))
+        os.utime(os.path.join(self.cache_dir, 'old.cache'), (time.time() - 10, time.time() - 10))
+        self.assertTrue(cache.get('old', output))
+
+        cache.put('newest', self.write('newest', b'12345'))
+
+        self.assertTrue(cache.get('old', output))
+        self.assertFalse(cache.get('new', output))
+        self.assertTrue(cache.get('newest', output))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ResultCache(self.cache_dir, ttl=0)
+        with self.assertRaises(ValueError):
+            ResultCache(self.cache_dir, ttl=60, max_bytes=-1)
@@ -0,0 +1,74 @@
+import gzip
+import importlib.util
+import io
+import unittest
+import zlib
+
+from redshift_unloader import compression
+from redshift_unloader.compression import Encoder, ParallelGzipEncoder, ZstdEncoder
+
+
+class TestCompression(unittest.TestCase):
+    def test_validate(self):
+        compression.validate('gzip_single')
+
+        with self.assertRaises(ValueError):
+            compression.validate('bzip2')
+
+    def test_decompress(self):
+        data = gzip.compress(b'header\n') + gzip.compress(b'1,a\n') + gzip.compress(b'2,bb\n')
+        chunks = [data[i:i + 5] for i in range(0, len(data), 5)]
+
+        self.assertEqual(b''.join(compression.decompress(chunks)), b'header\n1,a\n2,bb\n')
+
+    def test_encoder(self):
+        fileobj = io.BytesIO()
+        with compression.open_encoder('plain', fileobj) as encoder:
+            self.assertIsInstance(encoder, Encoder)
+            encoder.write(b'1,a\n')
+
+        self.assertEqual(fileobj.getvalue(), b'1,a\n')
+
+    def test_parallel_gzip_encoder(self):
+        data = b''.join(f'{i},{i * i}\n'.encode() for i in range(10000))
+        fileobj = io.BytesIO()
+
+        with ParallelGzipEncoder(fileobj, concurrency=4, block_size=1000) as encoder:
+            for i in range(0, len(data), 777):
+                encoder.write(data[i:i + 777])
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(fileobj.getvalue()), data)
+        self.assertTrue(decompressor.eof)
+        self.assertEqual(decompressor.unused_data, b'')
+
+        with self.assertRaises(ValueError):
+            ParallelGzipEncoder(io.BytesIO(), block_size=0)
+
+    def test_parallel_gzip_encoder_abort(self):
+        fileobj = io.BytesIO()
+
+        with self.assertRaises(IOError):
+            with ParallelGzipEncoder(fileobj, block_size=4) as encoder:
+                encoder.write(b'1,a\n2,bb\n')
+                raise IOError('connection reset')
+
+        with self.assertRaises(EOFError):
+            gzip.decompress(fileobj.getvalue())
+
+    @unittest.skipIf(importlib.util.find_spec('zstandard') is None, "zstandard is not installed")
+    def test_zstd_encoder(self):
+        fileobj = io.BytesIO()
+        with compression.open_encoder('zstd', fileobj, concurrency=2) as encoder:
+            self.assertIsInstance(encoder, ZstdEncoder)
+            encoder.write(b'1,a\n')
+            encoder.write(b'2,bb\n')
+
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(fileobj.getvalue()))
+        self.assertEqual(reader.read(), b'1,a\n2,bb\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import gzip
+import importlib.util
+import unittest
+
+from redshift_unloader import dataframe
+from redshift_unloader.redshift import Column
+
+
+@unittest.skipIf(importlib.util.find_spec('pandas') is None, "pandas is not installed")
+class TestDataFrame(unittest.TestCase):
+    COLUMNS = [Column(name='id', type_code=dataframe.INT8),
+               Column(name='name', type_code=1043),
+               Column(name='score', type_code=dataframe.FLOAT8),
+               Column(name='active', type_code=dataframe.BOOL),
+               Column(name='created_at', type_code=dataframe.TIMESTAMP)]
+
+    def test_parse_slice(self):
+        data = gzip.compress(b'"1","a\\"b","1.5","t","2018-01-01 00:00:00"\n'
+                             b'"2","","","f",""\n')
+
+        frame = dataframe.parse_slice(data, self.COLUMNS)
+
+        self.assertListEqual(list(frame.columns), ['id', 'name', 'score', 'active', 'created_at'])
+        self.assertEqual(str(frame['id'].dtype), 'Int64')
+        self.assertEqual(str(frame['active'].dtype), 'boolean')
+        self.assertListEqual(frame['id'].tolist(), [1, 2])
+        self.assertEqual(frame['name'][0], 'a"b')
+        self.assertTrue(frame['name'].isna()[1])
+        self.assertTrue(frame['score'].isna()[1])
+        self.assertListEqual(frame['active'].tolist(), [True, False])
+        self.assertEqual(str(frame['created_at'][0]), '2018-01-01 00:00:00')
+        self.assertTrue(frame['created_at'].isna()[1])
+
+    def test_parse_slice_without_quotes(self):
+        data = gzip.compress(b'1|NULL|0.5|t|2018-01-01 00:00:00\n')
+
+        frame = dataframe.parse_slice(data, self.COLUMNS, delimiter='|', add_quotes=False, escape=False,
+                                      null_string='NULL')
+
+        self.assertTrue(frame['name'].isna()[0])
+        self.assertEqual(frame['score'][0], 0.5)
+
+    def test_concat(self):
+        frames = [dataframe.parse_slice(gzip.compress(f'"{i}","a","1","t",""\n'.encode()), self.COLUMNS)
+                  for i in range(3)]
+
+        frame = dataframe.concat(frames, self.COLUMNS)
+        self.assertListEqual(frame['id'].tolist(), [0, 1, 2])
+        self.assertListEqual(dataframe.to_numpy(frame)['score'].tolist(), [1.0, 1.0, 1.0])
+
+        empty = dataframe.concat([], self.COLUMNS)
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(str(empty['id'].dtype), 'Int64')
+        self.assertListEqual(list(empty.columns), ['id', 'name', 'score', 'active', 'created_at'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import json
+import unittest
+
+from redshift_unloader.manifest import Manifest, ManifestEntry
+
+
+class TestManifest(unittest.TestCase):
+    DOCUMENT = {
+        "entries": [
+            {"url": "s3://some-bucket/path/to/0000_part_00.gz",
+             "meta": {"content_length": 100, "record_count": 10}},
+            {"url": "s3://some-bucket/path/to/0001_part_00.gz",
+             "meta": {"content_length": 300, "record_count": 25}}
+        ],
+        "schema": {
+            "elements": [
+                {"name": "column1", "type": {"base": "integer"}},
+                {"name": "column2", "type": {"base": "character varying", "max_length": 16}}
+            ]
+        },
+        "meta": {"content_length": 400, "record_count": 35}
+    }
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_from_json(self):
+        manifest = Manifest.from_json(json.dumps(self.DOCUMENT))
+
+        expected = [
+            ManifestEntry(key='path/to/0000_part_00.gz', content_length=100, record_count=10),
+            ManifestEntry(key='path/to/0001_part_00.gz', content_length=300, record_count=25)
+        ]
+
+        self.assertListEqual(manifest.entries, expected)
+        self.assertListEqual(manifest.columns, ['column1', 'column2'])
+        self.assertEqual(manifest.content_length, 400)
+        self.assertEqual(manifest.record_count, 35)
+
+    def test_from_json_without_verbose(self):
+        manifest = Manifest.from_json('{"entries": [{"url": "s3://some-bucket/path/to/0000_part_00.gz"}]}')
+
+        self.assertListEqual(manifest.entries, [ManifestEntry(key='path/to/0000_part_00.gz',
+                                                              content_length=0, record_count=0)])
+        self.assertListEqual(manifest.columns, [])
@@ -0,0 +1,73 @@
+import threading
+import unittest
+
+from unittest import mock
+
+from redshift_unloader.metrics import ContextThreadPoolExecutor, Metrics, StageMetric, count_retries
+
+
+class TestMetrics(unittest.TestCase):
+    def test_measure(self):
+        records = []
+        metrics = Metrics(records.append)
+
+        with mock.patch('time.perf_counter', side_effect=[10.0, 12.5]):
+            with metrics.measure('session_id', 'download') as timer:
+                timer.bytes = 100
+                timer.objects = 2
+
+        self.assertListEqual(records, [StageMetric(session_id='session_id', stage='download', duration=2.5,
+                                                   bytes=100, objects=2)])
+        self.assertTrue(records[0].succeeded)
+
+    def test_measure_failure(self):
+        records = []
+        metrics = Metrics(records.append)
+        error = IOError('connection reset')
+
+        with self.assertRaises(IOError):
+            with metrics.measure('session_id', 'unload'):
+                raise error
+
+        self.assertEqual(records[0].stage, 'unload')
+        self.assertIs(records[0].error, error)
+        self.assertFalse(records[0].succeeded)
+
+    def test_count_retries(self):
+        records = []
+        metrics = Metrics(records.append)
+        entered = threading.Event()
+        counted = threading.Event()
+
+        def other_session():
+            with metrics.measure('other', 'download'):
+                entered.set()
+                counted.wait(5)
+
+        thread = threading.Thread(target=other_session)
+        thread.start()
+        self.assertTrue(entered.wait(5))
+
+        count_retries(5)
+        with metrics.measure('session_id', 'download'), ContextThreadPoolExecutor(max_workers=2) as executor:
+            count_retries(1)
+            list(executor.map(count_retries, [2, 3]))
+        counted.set()
+        thread.join()
+
+        self.assertListEqual([(record.session_id, record.retries) for record in records],
+                             [('session_id', 6), ('other', 0)])
+
+    def test_subscribe(self):
+        records = []
+        metrics = Metrics(mock.Mock(side_effect=RuntimeError('broken callback')))
+        metrics.subscribe(records.append)
+
+        metric = StageMetric(session_id='session_id', stage='delete', duration=0.1, objects=3)
+        metrics.record(metric)
+
+        self.assertListEqual(records, [metric])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import io
+import os
+import tempfile
+import unittest
+
+from redshift_unloader.output import preallocate, pwrite_all, write_all
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_preallocate(self):
+        with open(self.filename, 'wb') as f:
+            preallocate(f.fileno(), 100)
+
+        self.assertEqual(os.path.getsize(self.filename), 100)
+
+    def test_pwrite_all(self):
+        with open(self.filename, 'wb') as f:
+            preallocate(f.fileno(), 10)
+            pwrite_all(f.fileno(), b'abcdef', 4)
+            pwrite_all(f.fileno(), b'0123', 0)
+
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123abcdef')
+
+    def test_write_all(self):
+        class ShortWriter(io.RawIOBase):
+            def __init__(self):
+                self.chunks = []
+
+            def writable(self):
+                return True
+
+            def write(self, data):
+                self.chunks.append(bytes(data[:3]))
+                return len(self.chunks[-1])
+
+        writer = ShortWriter()
+        write_all(writer, b'abcdefgh')
+
+        self.assertListEqual(writer.chunks, [b'abc', b'def', b'gh'])
@@ -0,0 +1,57 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from redshift_unloader import dataframe, parquet
+from redshift_unloader.redshift import Column
+
+if importlib.util.find_spec('pyarrow') is not None:
+    import pyarrow
+    import pyarrow.parquet
+
+
+@unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow is not installed")
+class TestParquet(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.sources = []
+        for i, values in enumerate([[1, 2], [3], [4, 5, 6]]):
+            source = os.path.join(self.temp_dir, f'000{i}_part_00.parquet')
+            pyarrow.parquet.write_table(pyarrow.table({'column1': values}), source)
+            self.sources.append(source)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parquet_merger(self):
+        filename = os.path.join(self.temp_dir, 'result.parquet')
+
+        with parquet.ParquetMerger(filename) as merger:
+            for source in self.sources:
+                merger.append(source)
+
+        merged = pyarrow.parquet.ParquetFile(filename)
+
+        self.assertEqual(merged.num_row_groups, 3)
+        self.assertListEqual(merged.read().column('column1').to_pylist(), [1, 2, 3, 4, 5, 6])
+
+    def test_concat_tables(self):
+        table = parquet.concat_tables([parquet.read_table(source) for source in self.sources])
+
+        self.assertListEqual(table.column('column1').to_pylist(), [1, 2, 3, 4, 5, 6])
+
+        with self.assertRaises(ValueError):
+            parquet.concat_tables([])
+
+    def test_empty_table(self):
+        columns = [Column(name='id', type_code=dataframe.INT4), Column(name='created_at', type_code=dataframe.DATE),
+                   Column(name='name', type_code=1043)]
+
+        table = parquet.empty_table(columns)
+
+        self.assertEqual(table.num_rows, 0)
+        self.assertTrue(table.schema.equals(pyarrow.schema([('id', pyarrow.int32()), ('created_at', pyarrow.date32()),
+                                                            ('name', pyarrow.string())])))
@@ -0,0 +1,44 @@
+import unittest
+
+from redshift_unloader import partition
+from redshift_unloader.s3 import S3Object
+
+
+class TestPartition(unittest.TestCase):
+    def test_balance(self):
+        objects = [S3Object(key=f'object{i}', size=size, etag='') for i, size in enumerate([5, 1, 4, 3, 3])]
+
+        actual = partition.balance(objects, 2)
+
+        self.assertListEqual([[obj.key for obj in group] for group in actual],
+                             [['object0', 'object4'], ['object1', 'object2', 'object3']])
+        self.assertListEqual([len(group) for group in partition.balance(objects, 10)], [1] * 5)
+        self.assertListEqual(partition.balance([], 3), [[]])
+
+        with self.assertRaises(ValueError):
+            partition.balance(objects, 0)
+
+    def test_group(self):
+        objects = [S3Object(key='prefix/a=1/b=x/0000_part_00', size=1, etag=''),
+                   S3Object(key='prefix/0000_part_00', size=1, etag=''),
+                   S3Object(key='prefix/a=1/b=x/0001_part_00', size=1, etag='')]
+
+        actual = partition.group(objects, 'prefix/')
+
+        self.assertDictEqual({name: [obj.key for obj in group] for name, group in actual.items()},
+                             {'a=1/b=x': ['prefix/a=1/b=x/0000_part_00', 'prefix/a=1/b=x/0001_part_00'],
+                              '': ['prefix/0000_part_00']})
+
+        with self.assertRaises(ValueError):
+            partition.group(objects, 'other/')
+
+    def test_parse(self):
+        self.assertDictEqual(partition.parse(''), {})
+        self.assertDictEqual(partition.parse('a=1/b=x%2Fy/c=__HIVE_DEFAULT_PARTITION__'),
+                             {'a': '1', 'b': 'x/y', 'c': None})
+
+    def test_rows(self):
+        self.assertEqual(partition.rows([S3Object(key='a', size=1, etag='', record_count=2),
+                                         S3Object(key='b', size=1, etag='', record_count=3)]), 5)
+        self.assertIsNone(partition.rows([S3Object(key='a', size=1, etag='', record_count=2),
+                                          S3Object(key='b', size=1, etag='')]))
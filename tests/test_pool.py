@@ -0,0 +1,80 @@
+import os
+import threading
+import unittest
+
+from unittest import mock
+
+from redshift_unloader.pool import Pool, shared
+
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_acquire_reuses_items(self):
+        factory = mock.Mock(side_effect=lambda: object())
+        pool = Pool(factory, size=2)
+
+        with pool.acquire() as first:
+            pass
+        with pool.acquire() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(factory.call_count, 1)
+
+    def test_acquire_is_bounded(self):
+        factory = mock.Mock(side_effect=lambda: object())
+        pool = Pool(factory, size=2)
+        acquired = []
+
+        def worker():
+            with pool.acquire() as item:
+                acquired.append(item)
+
+        with pool.acquire() as first, pool.acquire() as second:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+
+        thread.join()
+
+        self.assertEqual(factory.call_count, 2)
+        self.assertIn(acquired[0], [first, second])
+
+    def test_failed_factory_releases_slot(self):
+        factory = mock.Mock(side_effect=[RuntimeError('connection refused'), 'item'])
+        pool = Pool(factory, size=1)
+
+        with self.assertRaises(RuntimeError):
+            with pool.acquire():
+                pass
+        with pool.acquire() as item:
+            self.assertEqual(item, 'item')
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            Pool(lambda: None, size=0)
+
+    def test_shared(self):
+        factory = mock.Mock(side_effect=lambda: object())
+
+        first = shared(('test_shared', 1), factory, size=2)
+        second = shared(('test_shared', 1), lambda: None, size=2)
+        other = shared(('test_shared', 2), factory, size=2)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        with first.acquire() as item:
+            pass
+        with second.acquire() as reused:
+            self.assertIs(reused, item)
+        factory.assert_called_once_with()
+
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            forked = shared(('test_shared', 1), factory, size=2)
+        self.assertIsNot(forked, first)
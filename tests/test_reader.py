@@ -0,0 +1,28 @@
+import io
+import unittest
+
+from redshift_unloader import reader
+
+
+class TestReader(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_iter_rows(self):
+        stream = io.BytesIO(b'"a","b\\"c",""\n"x\\,y","multi\\\nline","\\\\"\n')
+
+        actual = list(reader.iter_rows(stream))
+        expected = [['a', 'b"c', None], ['x,y', 'multi\nline', '\\']]
+
+        self.assertListEqual(actual, expected)
+
+    def test_iter_rows_without_quotes(self):
+        stream = io.BytesIO(b'1|\\|x|NULL\n2|y|\n')
+
+        actual = list(reader.iter_rows(stream, delimiter='|', add_quotes=False, null_string='NULL'))
+        expected = [['1', '|x', None], ['2', 'y', '']]
+
+        self.assertListEqual(actual, expected)
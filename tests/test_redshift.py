@@ -1,3 +1,4 @@
+import psycopg2
 import unittest
 
 from unittest import mock
@@ -5,7 +6,7 @@ from mock import PropertyMock
 from collections import namedtuple
 
 from redshift_unloader.credential import Credential
-from redshift_unloader.redshift import Redshift
+from redshift_unloader.redshift import Column, Redshift
 
 
 class TestRedshift(unittest.TestCase):
@@ -17,9 +18,12 @@ class TestRedshift(unittest.TestCase):
     ACCESS_KEY_ID = 'test_access_key'
     SECRET_ACCESS_KEY = 'test_secret_key'
 
-    @mock.patch('psycopg2.connect')
-    def setUp(self, mock_connect):
-        self.mock_cursor = mock_connect.return_value.cursor.return_value
+    def setUp(self):
+        connect_patcher = mock.patch('psycopg2.connect')
+        self.mock_connect = connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+        self.mock_connect.return_value.closed = 0
+        self.mock_cursor = self.mock_connect.return_value.cursor.return_value
 
         self.credential = Credential(access_key_id=self.ACCESS_KEY_ID, secret_access_key=self.SECRET_ACCESS_KEY)
         self.redshift = Redshift(host=self.HOST, port=self.PORT, user=self.USER, password=self.PASSWORD,
@@ -28,6 +32,68 @@ class TestRedshift(unittest.TestCase):
     def tearDown(self):
         pass
 
+    def test_connect_lazily(self):
+        self.mock_connect.assert_not_called()
+        self.mock_cursor.fetchone.return_value = (4,)
+
+        self.redshift.get_slice_count()
+        self.redshift.get_slice_count()
+
+        self.mock_connect.assert_called_once_with(host=self.HOST, port=self.PORT, user=self.USER,
+                                                  password=self.PASSWORD, database=self.DATABASE, keepalives=1,
+                                                  keepalives_idle=60, keepalives_interval=10, keepalives_count=5)
+
+    def test_reconnect(self):
+        dropped = mock.Mock(closed=2)
+        dropped.cursor.return_value.execute.side_effect = psycopg2.OperationalError('server closed the connection')
+        self.mock_connect.side_effect = [dropped, self.mock_connect.return_value]
+        self.mock_cursor.fetchone.return_value = (4,)
+
+        self.assertEqual(self.redshift.get_slice_count(), 4)
+        self.assertEqual(self.mock_connect.call_count, 2)
+        dropped.close.assert_called_once_with()
+
+        self.mock_connect.return_value.closed = 0
+        self.mock_cursor.execute.side_effect = psycopg2.OperationalError('division by zero')
+        with self.assertRaises(psycopg2.OperationalError):
+            self.redshift.get_slice_count()
+        self.assertEqual(self.mock_connect.call_count, 2)
+
+    def test_unload_is_not_run_again(self):
+        dropped = mock.Mock(closed=0)
+        self.mock_connect.side_effect = [dropped, self.mock_connect.return_value]
+
+        def drop(sql):
+            dropped.closed = 2
+            raise psycopg2.OperationalError('server closed the connection')
+
+        dropped.cursor.return_value.execute.side_effect = drop
+        with self.assertRaises(psycopg2.OperationalError):
+            self.redshift.unload('SELECT * FROM some_table', 's3://bucket/path/')
+        dropped.cursor.return_value.execute.assert_called_once()
+        self.assertEqual(self.mock_connect.call_count, 1)
+        dropped.close.assert_called_once_with()
+
+        self.redshift.unload('SELECT * FROM some_table', 's3://bucket/path/')
+        self.assertEqual(self.mock_connect.call_count, 2)
+        self.mock_cursor.execute.assert_called_once()
+
+    def test_unload_checks_reused_connection(self):
+        stale = mock.Mock(closed=0)
+        stale.cursor.return_value.fetchone.return_value = (4,)
+        self.mock_connect.side_effect = [stale, self.mock_connect.return_value]
+        self.redshift.get_slice_count()
+
+        stale.closed = 2
+        self.redshift.unload('SELECT * FROM some_table', 's3://bucket/path/')
+        self.assertEqual(self.mock_connect.call_count, 2)
+        self.mock_cursor.execute.assert_called_once()
+
+        self.mock_cursor.execute.reset_mock()
+        self.redshift.unload('SELECT * FROM some_table', 's3://bucket/path/')
+        self.assertEqual(self.mock_cursor.execute.call_args_list[0], mock.call('SELECT 1'))
+        self.assertTrue(self.mock_cursor.execute.call_args_list[1][0][0].startswith('UNLOAD'))
+
     def test_get_columns(self):
         query = "SELECT * FROM some_table WHERE date_column >= '2018-01-01'"
 
@@ -44,6 +110,50 @@ class TestRedshift(unittest.TestCase):
         self.assertListEqual(actual, expected)
         self.mock_cursor.execute.assert_called_once()
 
+    def test_describe(self):
+        query = "SELECT * FROM some_table"
+
+        Description = namedtuple('Description', ('name', 'type_code'))
+
+        description = PropertyMock()
+        description.return_value = [Description(name='column1', type_code=23),
+                                    Description(name='column2', type_code=1043)]
+
+        type(self.mock_cursor).description = description
+
+        actual = self.redshift.describe(query)
+        expected = [Column(name='column1', type_code=23), Column(name='column2', type_code=1043)]
+
+        self.assertListEqual(actual, expected)
+        self.mock_cursor.execute.assert_called_once_with("WITH query AS (SELECT * FROM some_table) "
+                                                         "SELECT * FROM query LIMIT 0")
+
+    def test_get_range(self):
+        query = "SELECT * FROM some_table"
+        self.mock_cursor.fetchone.return_value = (1, 100)
+
+        actual = self.redshift.get_range(query, 'id')
+
+        self.assertEqual(actual, (1, 100))
+        self.mock_cursor.execute.assert_called_once_with(
+            "WITH query AS (SELECT * FROM some_table) SELECT MIN(id), MAX(id) FROM query")
+
+    def test_get_slice_count(self):
+        self.mock_cursor.fetchone.return_value = (16,)
+
+        self.assertEqual(self.redshift.get_slice_count(), 16)
+        self.mock_cursor.execute.assert_called_once_with("SELECT COUNT(*) FROM stv_slices")
+
+    def test_estimate_size(self):
+        query = "SELECT * FROM some_table"
+        self.mock_cursor.fetchone.return_value = ('XN Seq Scan on some_table  (cost=0.00..1.00 rows=1000 width=24)',)
+
+        self.assertEqual(self.redshift.estimate_size(query), 24000)
+        self.mock_cursor.execute.assert_called_once_with("EXPLAIN SELECT * FROM some_table")
+
+        self.mock_cursor.fetchone.return_value = ('XN Result',)
+        self.assertIsNone(self.redshift.estimate_size(query))
+
     def test_unload(self):
         query = "SELECT * FROM some_table WHERE date_column >= '2018-01-01'"
         s3_uri = "s3://some-bucket/path/to/"
@@ -60,6 +170,58 @@ class TestRedshift(unittest.TestCase):
 
         self.mock_cursor.execute.assert_called_once_with(expected_query)
 
+    def test_unload_with_verbose_manifest(self):
+        query = "SELECT * FROM some_table"
+        s3_uri = "s3://some-bucket/path/to/"
+
+        self.redshift.unload(query, s3_uri, manifest=True, verbose_manifest=True)
+
+        expected_query = " ".join([
+            "UNLOAD ('SELECT * FROM some_table')",
+            "TO 's3://some-bucket/path/to/'",
+            "ACCESS_KEY_ID 'test_access_key'",
+            "SECRET_ACCESS_KEY 'test_secret_key'",
+            "MANIFEST VERBOSE",
+            "PARALLEL ON"
+        ])
+
+        self.mock_cursor.execute.assert_called_once_with(expected_query)
+
+    def test_unload_parquet(self):
+        query = "SELECT * FROM some_table"
+        s3_uri = "s3://some-bucket/path/to/"
+
+        self.redshift.unload(query, s3_uri, file_format='PARQUET')
+
+        expected_query = " ".join([
+            "UNLOAD ('SELECT * FROM some_table')",
+            "TO 's3://some-bucket/path/to/'",
+            "ACCESS_KEY_ID 'test_access_key'",
+            "SECRET_ACCESS_KEY 'test_secret_key'",
+            "FORMAT PARQUET",
+            "PARALLEL ON"
+        ])
+
+        self.mock_cursor.execute.assert_called_once_with(expected_query)
+
+    def test_unload_partition_by(self):
+        query = "SELECT * FROM some_table"
+        s3_uri = "s3://some-bucket/path/to/"
+
+        self.redshift.unload(query, s3_uri, gzip=True, partition_by=['year', 'month'])
+
+        expected_query = " ".join([
+            "UNLOAD ('SELECT * FROM some_table')",
+            "TO 's3://some-bucket/path/to/'",
+            "ACCESS_KEY_ID 'test_access_key'",
+            "SECRET_ACCESS_KEY 'test_secret_key'",
+            "GZIP",
+            "PARALLEL ON",
+            "PARTITION BY (year, month)"
+        ])
+
+        self.mock_cursor.execute.assert_called_once_with(expected_query)
+
     def test__escaped_query(self):
         query = "SELECT * FROM some_table WHERE date_column >= '2018-01-01'"
 
@@ -1,9 +1,24 @@
+import concurrent.futures
+import gzip
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import zlib
 
 from unittest import mock
 from mock import call
 
-from redshift_unloader import RedshiftUnloader
+from redshift_unloader import (FileWatermarkStore, Metrics, RedshiftUnloader, ResultCache, UnloadJob, Watermark,
+                               dataframe)
+from redshift_unloader.manifest import Manifest, ManifestEntry
+from redshift_unloader.redshift import Column
+from redshift_unloader.s3 import S3Object
 
 
 class TestRedshiftUnloader(unittest.TestCase):
@@ -16,78 +31,781 @@ class TestRedshiftUnloader(unittest.TestCase):
     REGION = 'ap-northeast-1'
     ACCESS_KEY_ID = 'test_access_key'
     SECRET_ACCESS_KEY = 'test_secret_key'
+    SESSION_PATH = 'tmp/redshift-unloader/session_id/'
 
-    @mock.patch('redshift_unloader.redshift_unloader.S3')
-    @mock.patch('redshift_unloader.redshift_unloader.Redshift')
-    def setUp(self, mock_redshift, mock_s3):
-        self.redshift = mock_redshift.return_value
-        self.s3 = mock_s3.return_value
+    def setUp(self):
+        redshift_patcher = mock.patch('redshift_unloader.redshift_unloader.Redshift')
+        s3_patcher = mock.patch('redshift_unloader.redshift_unloader.S3')
+        self.mock_redshift = redshift_patcher.start()
+        self.mock_s3 = s3_patcher.start()
+        self.addCleanup(redshift_patcher.stop)
+        self.addCleanup(s3_patcher.stop)
 
-        self.unloader = RedshiftUnloader(host=self.HOST, port=self.PORT, user=self.USER, password=self.PASSWORD,
-                                         database=self.DATABASE, s3_bucket=self.S3_BUCKET,
-                                         access_key_id=self.ACCESS_KEY_ID, secret_access_key=self.SECRET_ACCESS_KEY,
-                                         region=self.REGION)
+        uuid4_patcher = mock.patch('uuid.uuid4', return_value='session_id')
+        uuid4_patcher.start()
+        self.addCleanup(uuid4_patcher.stop)
+
+        self.redshift = self.mock_redshift.return_value
+        self.s3 = self.mock_s3.return_value
+
+        self.unloader = self.create_unloader()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.bodies = {}
+        self.s3.retries = 0
+        self.s3.uri.side_effect = lambda x: f's3://bucket{x}'
+        self.s3.list_objects.side_effect = lambda path: [S3Object(key=key, size=len(body), etag=f'"{key}"')
+                                                         for key, body in self.bodies.items()
+                                                         if key.startswith(path)]
+        self.s3.download_into.side_effect = lambda key, fd, offset, size: os.pwrite(fd, self.bodies[key], offset)
+        self.s3.open.side_effect = lambda key: io.BytesIO(self.bodies[key])
+        self.s3.read_range.side_effect = lambda key, start, end: self.bodies[key][start:end]
+
+    def create_unloader(self, **kwargs):
+        return RedshiftUnloader(host=self.HOST, port=self.PORT, user=self.USER, password=self.PASSWORD,
+                                database=self.DATABASE, s3_bucket=self.S3_BUCKET,
+                                access_key_id=self.ACCESS_KEY_ID, secret_access_key=self.SECRET_ACCESS_KEY,
+                                region=self.REGION, **kwargs)
 
     def tearDown(self):
         pass
 
-    @mock.patch('builtins.open')
-    @mock.patch('shutil.copyfileobj')
-    @mock.patch('shutil.rmtree')
-    @mock.patch('os.mkdir')
-    @mock.patch('tempfile.gettempdir')
-    def test_unload(self, mock_gettempdir, mock_mkdir, mock_rmtree, mock_copyfileobj, mock_open):
-        temp_dir = '/tmp'
-        mock_gettempdir.return_value = temp_dir
+    def assertDeleted(self, keys):
+        self.assertCountEqual([key for args, _ in self.s3.delete.call_args_list for key in args[0]], keys)
 
+    def test_unload(self):
         query = 'some_query'
-        filename = '/path/to/output'
+        filename = os.path.join(self.temp_dir, 'output')
 
         session_id = 'session_id'
-
         s3_path = "tmp/redshift-unloader/session_id/"
-        local_path = f"{temp_dir}/{session_id}"
-
         s3_uri = f's3://bucket/{s3_path}'
-        objects = ['object1', 'object2']
 
-        s3_keys = list(map(lambda x: f'{s3_path}{x}', objects))
-        local_files = list(map(lambda x: f'{local_path}/{x}', objects))
+        self.bodies = {f'{s3_path}object1': gzip.compress(b'"1","a"\n'),
+                       f'{s3_path}object2': gzip.compress(b'"2","bb"\n"3","ccc"\n')}
+        s3_keys = list(self.bodies)
 
         with mock.patch.object(self.unloader,
                                '_RedshiftUnloader__generate_session_id',
                                return_value=session_id):
             self.redshift.get_columns.return_value = ['"column1"', '"column2"']
-            self.s3.list.return_value = s3_keys
-            self.s3.uri.side_effect = lambda x: f's3://bucket{x}'
 
             self.unloader.unload(query, filename)
 
-            self.unloader._RedshiftUnloader__redshift.get_columns.assert_called_once_with(query, True)
+            self.redshift.get_columns.assert_called_once_with(query, True)
 
             self.unloader._RedshiftUnloader__s3.uri.assert_called_once_with(f"/{s3_path}")
-            self.unloader._RedshiftUnloader__redshift.unload.assert_called_once_with(query, s3_uri,
-                                                                                     gzip=True,
-                                                                                     parallel=True,
-                                                                                     delimiter=',',
-                                                                                     null_string='',
-                                                                                     add_quotes=True,
-                                                                                     escape=True,
-                                                                                     allow_overwrite=True)
+            self.redshift.unload.assert_called_once_with(query, s3_uri,
+                                                         manifest=False,
+                                                         verbose_manifest=False,
+                                                         gzip=True,
+                                                         parallel=True,
+                                                         delimiter=',',
+                                                         null_string='',
+                                                         add_quotes=True,
+                                                         escape=True,
+                                                         allow_overwrite=True)
+
+            self.unloader._RedshiftUnloader__s3.list_objects.assert_called_once_with(s3_path)
+
+            header = gzip.compress(f'"column1","column2"{os.linesep}'.encode())
+            self.assertCountEqual(self.s3.download_into.call_args_list, [
+                call(key=s3_keys[0], fd=mock.ANY, offset=len(header), size=len(self.bodies[s3_keys[0]])),
+                call(key=s3_keys[1], fd=mock.ANY, offset=len(header) + len(self.bodies[s3_keys[0]]),
+                     size=len(self.bodies[s3_keys[1]]))
+            ])
+
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), header + b''.join(self.bodies.values()))
+            with gzip.open(filename, 'rb') as f:
+                self.assertEqual(f.read(), f'"column1","column2"{os.linesep}"1","a"\n"2","bb"\n"3","ccc"\n'.encode())
+
+            self.assertDeleted(s3_keys)
+
+    def test_unload_failure_keeps_objects(self):
+        self.bodies = {'tmp/redshift-unloader/session_id/object1': b'object1'}
+        self.s3.download_into.side_effect = IOError('connection reset')
+
+        with mock.patch.object(self.unloader, '_RedshiftUnloader__generate_session_id', return_value='session_id'):
+            with self.assertRaises(IOError):
+                self.unloader.unload('some_query', os.path.join(self.temp_dir, 'output'), with_header=False)
+
+        self.s3.delete.assert_not_called()
+
+    def test_unload_with_cache(self):
+        unloader = self.create_unloader(cache=ResultCache(os.path.join(self.temp_dir, 'cache'), ttl=60))
+        filename = os.path.join(self.temp_dir, 'output')
+        self.bodies = {f'{self.SESSION_PATH}object1': b'object1'}
+
+        unloader.unload('SELECT * FROM some_table', filename, with_header=False)
+        os.remove(filename)
+        unloader.unload('SELECT *\n  FROM some_table;', filename, with_header=False)
+
+        self.assertEqual(self.redshift.unload.call_count, 1)
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'object1')
+
+        unloader.unload('SELECT * FROM some_table', filename, with_header=False, delimiter='|')
+        self.assertEqual(self.redshift.unload.call_count, 2)
+
+        source = dict(host=self.HOST, port=self.PORT, user=self.USER, database=self.DATABASE, s3_bucket=self.S3_BUCKET)
+        for other in [dict(host='staging'), dict(port=5440), dict(user='other'), dict(database='other'),
+                      dict(s3_bucket='other')]:
+            RedshiftUnloader(password=self.PASSWORD, access_key_id=self.ACCESS_KEY_ID,
+                             secret_access_key=self.SECRET_ACCESS_KEY, region=self.REGION,
+                             cache=ResultCache(os.path.join(self.temp_dir, 'cache'), ttl=60),
+                             **dict(source, **other)).unload('SELECT * FROM some_table', filename, with_header=False)
+        self.assertEqual(self.redshift.unload.call_count, 7)
+
+    def test_unload_resume(self):
+        unloader = self.create_unloader(concurrency=1)
+        filename = os.path.join(self.temp_dir, 'output')
+        state_file = filename + '.session'
+        self.bodies = {f'{self.SESSION_PATH}object1': b'object1', f'{self.SESSION_PATH}object2': b'obj2'}
+
+        def fail_on_object2(key, fd, offset, size):
+            if key.endswith('object2'):
+                raise IOError('connection reset')
+            os.pwrite(fd, self.bodies[key], offset)
+
+        self.s3.download_into.side_effect = fail_on_object2
+        with self.assertRaises(IOError):
+            unloader.unload('some_query', filename, with_header=False, resume=True)
+
+        self.assertTrue(os.path.exists(state_file))
+        self.s3.delete.assert_not_called()
+
+        self.s3.download_into.reset_mock(side_effect=True)
+        self.s3.download_into.side_effect = lambda key, fd, offset, size: os.pwrite(fd, self.bodies[key], offset)
+        with mock.patch('uuid.uuid4', return_value='another_session_id'):
+            unloader.unload('some_query', filename, with_header=False, resume=True)
+
+        self.assertEqual(self.redshift.unload.call_count, 1)
+        self.assertListEqual([c[1]['key'] for c in self.s3.download_into.call_args_list],
+                             [f'{self.SESSION_PATH}object2'])
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'object1obj2')
+        self.assertDeleted(list(self.bodies))
+        self.assertFalse(os.path.exists(state_file))
+
+    def test_unload_resume_another_query(self):
+        filename = os.path.join(self.temp_dir, 'output')
+        self.bodies = {f'{self.SESSION_PATH}object1': b'object1'}
+        self.s3.download_into.side_effect = IOError('connection reset')
+
+        with self.assertRaises(IOError):
+            self.unloader.unload('some_query', filename, with_header=False, resume=True)
+
+        self.s3.download_into.side_effect = lambda key, fd, offset, size: os.pwrite(fd, self.bodies[key], offset)
+        self.unloader.unload('another_query', filename, with_header=False, resume=True)
+
+        self.assertEqual(self.redshift.unload.call_count, 2)
+        self.assertFalse(os.path.exists(filename + '.session'))
+
+    def test_unload_metrics(self):
+        records = []
+        unloader = self.create_unloader(metrics=Metrics(records.append))
+        self.bodies = {f'{self.SESSION_PATH}object1': b'object1', f'{self.SESSION_PATH}object2': b'obj2'}
+        self.redshift.get_columns.return_value = ['"column1"']
+
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output'))
+
+        self.assertListEqual([(r.session_id, r.stage, r.objects, r.bytes) for r in records],
+                             [('session_id', 'unload', 0, 0), ('session_id', 'list', 2, 11),
+                              ('session_id', 'get_columns', 1, 0), ('session_id', 'download', 2, 11),
+                              ('session_id', 'delete', 2, 0)])
+        self.assertTrue(all(r.succeeded and r.duration >= 0 for r in records))
+
+    def test_unload_partitioned(self):
+        directory = os.path.join(self.temp_dir, 'export')
+        self.bodies = {f'{self.SESSION_PATH}0000_part_00.gz': gzip.compress(b'"1","a"\n"2","b"\n"3","c"\n'),
+                       f'{self.SESSION_PATH}0001_part_00.gz': gzip.compress(b'"4","d"\n'),
+                       f'{self.SESSION_PATH}0002_part_00.gz': gzip.compress(b'"5","e"\n')}
+        rows = [3, 1, 1]
+        self.s3.read_manifest.return_value = Manifest(
+            entries=[ManifestEntry(key=key, content_length=len(body), record_count=count)
+                     for (key, body), count in zip(self.bodies.items(), rows)],
+            columns=['column1', 'column2'])
+
+        files = self.unloader.unload_partitioned('some_query', directory, files=2)
+
+        _, kwargs = self.redshift.unload.call_args
+        self.assertTrue(kwargs['manifest'])
+        self.assertIsNone(kwargs['partition_by'])
+        self.assertListEqual([(f.path, f.partition, f.rows) for f in files],
+                             [('part-00000.gz', {}, 3), ('part-00001.gz', {}, 2)])
+        for f, expected in zip(files, [b'"1","a"\n"2","b"\n"3","c"\n', b'"4","d"\n"5","e"\n']):
+            filename = os.path.join(directory, f.path)
+            self.assertEqual(os.path.getsize(filename), f.bytes)
+            with gzip.open(filename, 'rb') as out:
+                self.assertEqual(out.read(), f'"column1","column2"{os.linesep}'.encode() + expected)
+
+        with open(os.path.join(directory, 'index.json')) as index:
+            document = json.load(index)
+        self.assertListEqual(document['columns'], ['column1', 'column2'])
+        self.assertListEqual([entry['path'] for entry in document['files']], ['part-00000.gz', 'part-00001.gz'])
+        self.assertListEqual([entry['rows'] for entry in document['files']], [3, 2])
+
+    @unittest.skipIf(not os.path.isdir('/proc/self/fd'), "/proc/self/fd is not available")
+    def test_unload_partitioned_opens_files_per_download(self):
+        unloader = self.create_unloader(concurrency=1)
+        directory = os.path.join(self.temp_dir, 'export')
+        self.bodies = {f'{self.SESSION_PATH}{i:04d}_part_00.gz': gzip.compress(f'"{i}"\n'.encode()) for i in range(4)}
+        self.s3.read_manifest.return_value = Manifest(
+            entries=[ManifestEntry(key=key, content_length=len(body), record_count=1)
+                     for key, body in self.bodies.items()],
+            columns=['column1'])
+
+        open_files = []
+
+        def download_into(key, fd, offset, size):
+            paths = [os.path.realpath(os.path.join('/proc/self/fd', name)) for name in os.listdir('/proc/self/fd')]
+            open_files.append(sum(path.startswith(os.path.realpath(directory)) for path in paths))
+            os.pwrite(fd, self.bodies[key], offset)
+
+        self.s3.download_into.side_effect = download_into
+
+        files = unloader.unload_partitioned('some_query', directory, files=4)
+
+        self.assertEqual(len(files), 4)
+        self.assertListEqual(open_files, [1, 1, 1, 1])
+
+    def test_unload_partitioned_by_columns(self):
+        directory = os.path.join(self.temp_dir, 'export')
+        self.bodies = {f'{self.SESSION_PATH}year=2020/0000_part_00.gz': gzip.compress(b'1,a\n'),
+                       f'{self.SESSION_PATH}year=2021/0000_part_00.gz': gzip.compress(b'2,b\n'),
+                       f'{self.SESSION_PATH}year=2021/0001_part_00.gz': gzip.compress(b'3,c\n'),
+                       f'{self.SESSION_PATH}year=__HIVE_DEFAULT_PARTITION__/0000_part_00.gz': gzip.compress(b'4,d\n')}
+        self.s3.read_manifest.return_value = Manifest(
+            entries=[ManifestEntry(key=key, content_length=len(body), record_count=1)
+                     for key, body in self.bodies.items()],
+            columns=[])
+        self.redshift.get_columns.return_value = ['id', 'name', 'year']
+
+        files = self.unloader.unload_partitioned('some_query', directory, partition_by=['year'], add_quotes=False)
+
+        _, kwargs = self.redshift.unload.call_args
+        self.assertListEqual(kwargs['partition_by'], ['year'])
+        self.redshift.get_columns.assert_called_once_with('some_query', False)
+        self.assertListEqual([(f.path, f.partition, f.rows) for f in files],
+                             [('year=2020/part-00000.gz', {'year': '2020'}, 1),
+                              ('year=2021/part-00000.gz', {'year': '2021'}, 2),
+                              ('year=__HIVE_DEFAULT_PARTITION__/part-00000.gz', {'year': None}, 1)])
+        with gzip.open(os.path.join(directory, 'year=2021', 'part-00000.gz'), 'rb') as out:
+            self.assertEqual(out.read(), f'id,name{os.linesep}2,b\n3,c\n'.encode())
+
+        with open(os.path.join(directory, 'index.json')) as index:
+            document = json.load(index)
+        self.assertListEqual(document['columns'], ['id', 'name'])
+        self.assertListEqual(document['partition_by'], ['year'])
+
+        self.assertDeleted(list(self.bodies) + [f'{self.SESSION_PATH}manifest'])
+
+        with self.assertRaises(ValueError):
+            self.unloader.unload_partitioned('some_query', directory, files=0)
+
+    def test_connect_lazily_and_share_connections(self):
+        self.mock_redshift.assert_not_called()
+        self.redshift.get_columns.return_value = ['"column1"']
+
+        self.create_unloader().unload('some_query', os.path.join(self.temp_dir, 'output1'))
+        self.unloader.unload('some_query', os.path.join(self.temp_dir, 'output2'))
+
+        self.mock_redshift.assert_called_once()
+        self.assertEqual(self.redshift.unload.call_count, 2)
+
+    def test_unload_deletes_in_batches_as_merged(self):
+        unloader = self.create_unloader(concurrency=1)
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n'),
+                       f'{self.SESSION_PATH}object2': gzip.compress(b'"2","bb"\n"3","ccc"\n')}
+        self.redshift.get_columns.return_value = ['"column1"', '"column2"']
+        keys = list(self.bodies)
+        events = []
+        deleted = threading.Event()
+
+        def download_into(key, fd, offset, size):
+            if key == keys[0]:
+                self.assertTrue(deleted.wait(5))
+            events.append(('download', key))
+            os.pwrite(fd, self.bodies[key], offset)
+
+        def delete(keys):
+            events.append(('delete', keys))
+            deleted.set()
+
+        self.s3.download_into.side_effect = download_into
+        self.s3.delete.side_effect = delete
+
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output'))
+
+        self.assertListEqual(events, [('download', keys[1]), ('delete', [keys[1]]),
+                                      ('download', keys[0]), ('delete', [keys[0]])])
+        self.assertDeleted(keys)
+
+    def test_sweep(self):
+        now = time.time()
+        self.s3.list_modified.return_value = [
+            ('tmp/redshift-unloader/old/0000_part_00', now - 2 * 24 * 60 * 60),
+            ('tmp/redshift-unloader/old/manifest', now - 2 * 24 * 60 * 60),
+            ('tmp/redshift-unloader/partly_old/0000/0000_part_00', now - 2 * 24 * 60 * 60),
+            ('tmp/redshift-unloader/partly_old/0001/0000_part_00', now - 60),
+            ('tmp/redshift-unloader/new/0000_part_00', now - 60),
+        ]
+
+        self.assertListEqual(self.unloader.sweep(), ['old'])
+        self.s3.list_modified.assert_called_once_with('tmp/redshift-unloader/')
+        self.assertDeleted(['tmp/redshift-unloader/old/0000_part_00', 'tmp/redshift-unloader/old/manifest'])
+
+        self.s3.delete.reset_mock()
+        self.assertListEqual(self.unloader.sweep(orphan_age=30), ['new', 'old', 'partly_old'])
+        self.assertEqual(len(self.s3.delete.call_args[0][0]), 5)
+
+        self.s3.delete.reset_mock()
+        self.s3.list_modified.return_value = [('tmp/redshift-unloader/new/0000_part_00', now - 60)]
+        self.assertListEqual(self.unloader.sweep(), [])
+        self.s3.delete.assert_not_called()
+
+        with self.assertRaises(ValueError):
+            self.create_unloader(orphan_age=0)
+
+    def test_sweep_in_background(self):
+        self.s3.list_modified.return_value = [('tmp/redshift-unloader/old/0000_part_00', 0.0)]
+        self.redshift.get_columns.return_value = ['"column1"']
+
+        self.unloader.unload('some_query', os.path.join(self.temp_dir, 'output1'))
+        self.s3.list_modified.assert_not_called()
+
+        unloader = self.create_unloader(sweep_orphans=True)
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output2'))
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output3'))
+        unloader._RedshiftUnloader__sweeper.join()
+
+        self.s3.list_modified.assert_called_once_with('tmp/redshift-unloader/')
+        self.s3.delete.assert_any_call(['tmp/redshift-unloader/old/0000_part_00'])
+
+    def test_unload_to_s3(self):
+        self.bodies = {f'{self.SESSION_PATH}object1': b'object1', f'{self.SESSION_PATH}object2': b'obj2'}
+        self.redshift.get_columns.return_value = ['"column1"']
+
+        uri = self.unloader.unload_to_s3('some_query', 'exports/result.csv.gz')
+
+        self.assertEqual(uri, 's3://bucketexports/result.csv.gz')
+        self.s3.concatenate.assert_called_once_with(self.s3.list_objects(self.SESSION_PATH), 'exports/result.csv.gz',
+                                                    gzip.compress(f'"column1"{os.linesep}'.encode()), 8)
+        self.s3.download_into.assert_not_called()
+        self.assertDeleted(list(self.bodies))
+
+    def test_unload_incremental(self):
+        filename = os.path.join(self.temp_dir, 'output.csv.gz')
+        store = FileWatermarkStore(os.path.join(self.temp_dir, 'watermarks.json'))
+        self.redshift.get_columns.return_value = ['"id"']
+
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1"\n"2"\n')}
+        self.redshift.get_range.return_value = (1, 2)
+        self.assertEqual(self.unloader.unload_incremental('some_query', filename, 'id', store), filename)
+
+        self.redshift.get_range.assert_called_once_with('some_query', 'id')
+        self.assertEqual(self.redshift.unload.call_args[0][0], 'SELECT * FROM (some_query) AS query WHERE id <= 2')
+        self.assertEqual(store.load(filename), Watermark(value=2, run=1))
+
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"3"\n')}
+        self.redshift.get_range.return_value = (3, 3)
+        self.unloader.unload_incremental('some_query', filename, 'id', store)
+
+        self.assertEqual(self.redshift.get_range.call_args[0][0],
+                         'SELECT * FROM (some_query) AS query WHERE id > 2')
+        self.assertEqual(self.redshift.unload.call_args[0][0],
+                         'SELECT * FROM (some_query) AS query WHERE id > 2 AND id <= 3')
+        self.assertEqual(self.redshift.get_columns.call_count, 1)
+        with gzip.open(filename, 'rb') as f:
+            self.assertEqual(f.read(), f'"id"{os.linesep}"1"\n"2"\n"3"\n'.encode())
+        self.assertEqual(store.load(filename), Watermark(value=3, run=2))
+
+        size = os.path.getsize(filename)
+        self.redshift.get_range.return_value = (4, 4)
+        self.s3.download_into.side_effect = IOError('connection reset')
+        with self.assertRaises(IOError):
+            self.unloader.unload_incremental('some_query', filename, 'id', store)
+
+        self.assertEqual(os.path.getsize(filename), size)
+        self.assertEqual(store.load(filename), Watermark(value=3, run=2))
+
+        self.redshift.get_range.return_value = (None, None)
+        self.assertIsNone(self.unloader.unload_incremental('some_query', filename, 'id', store))
+
+    def test_unload_incremental_roll(self):
+        filename = os.path.join(self.temp_dir, 'output.csv.gz')
+        store = FileWatermarkStore(os.path.join(self.temp_dir, 'watermarks.json'))
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1"\n')}
+        self.redshift.get_columns.return_value = ['"id"']
+        self.redshift.get_range.return_value = (1, 1)
+
+        first = self.unloader.unload_incremental('some_query', filename, 'id', store, mode='roll', key='events')
+        second = self.unloader.unload_incremental('some_query', filename, 'id', store, mode='roll', key='events')
+
+        self.assertEqual(first, os.path.join(self.temp_dir, 'output.000001.csv.gz'))
+        self.assertEqual(second, os.path.join(self.temp_dir, 'output.000002.csv.gz'))
+        with gzip.open(second, 'rb') as f:
+            self.assertEqual(f.read(), f'"id"{os.linesep}"1"\n'.encode())
+        self.assertEqual(store.load('events').run, 2)
+
+        with self.assertRaises(ValueError):
+            self.unloader.unload_incremental('some_query', filename, 'id', store, mode='replace')
+
+    def test_init_concurrency(self):
+        self.mock_s3.assert_called_once_with(credential=mock.ANY, bucket=self.S3_BUCKET, region=self.REGION,
+                                             max_pool_connections=32, part_size=8 * 1024 * 1024,
+                                             part_concurrency=4)
+
+        with self.assertRaises(ValueError):
+            self.create_unloader(concurrency=0)
+        with self.assertRaises(ValueError):
+            self.create_unloader(max_in_flight=0)
+        with self.assertRaises(ValueError):
+            self.create_unloader(part_size=0)
+        with self.assertRaises(ValueError):
+            self.create_unloader(part_concurrency=0)
+
+    @mock.patch('os.remove')
+    def test__download_and_merge(self, mock_remove):
+        unloader = self.create_unloader(concurrency=1, max_in_flight=1)
+        s3_keys = ['tmp/object1', 'tmp/object2', 'tmp/object3']
+        local_files = ['/tmp/object1', '/tmp/object2', '/tmp/object3']
+
+        events = []
+        self.s3.download.side_effect = lambda key, filename, size: events.append(('download', os.path.basename(key)))
+        merge = mock.Mock(side_effect=lambda path: events.append(('merge', os.path.basename(path))))
+
+        unloader._RedshiftUnloader__download_and_merge('session_id', s3_keys, local_files, [1, 1, 1], merge)
+
+        self.assertListEqual(events, [('download', 'object1'), ('merge', 'object1'),
+                                      ('download', 'object2'), ('merge', 'object2'),
+                                      ('download', 'object3'), ('merge', 'object3')])
+        self.assertListEqual(mock_remove.call_args_list, list(map(call, local_files)))
+
+        events.clear()
+        unloader._RedshiftUnloader__download_and_merge('session_id', s3_keys, local_files, [1, 3, 2], merge)
+
+        self.assertListEqual(events, [('download', 'object2'), ('download', 'object1'), ('merge', 'object1'),
+                                      ('merge', 'object2'), ('download', 'object3'), ('merge', 'object3')])
+
+    def test_unload_with_manifest(self):
+        unloader = self.create_unloader(concurrency=1)
+        filename = os.path.join(self.temp_dir, 'output')
+        self.bodies = {'tmp/object1': b'1', 'tmp/object2': b'333', 'tmp/object3': b'22'}
+        entries = [ManifestEntry(key=key, content_length=len(body), record_count=1)
+                   for key, body in self.bodies.items()]
+
+        self.s3.read_manifest.return_value = Manifest(entries=entries, columns=[])
+
+        with mock.patch.object(unloader, '_RedshiftUnloader__generate_session_id', return_value='session_id'):
+            unloader.unload('some_query', filename, with_header=False, manifest=True)
+
+        _, kwargs = self.redshift.unload.call_args
+        self.assertTrue(kwargs['manifest'])
+        self.assertTrue(kwargs['verbose_manifest'])
+        self.s3.read_manifest.assert_called_once_with('tmp/redshift-unloader/session_id/manifest')
+        self.s3.list_objects.assert_not_called()
+
+        self.assertListEqual([c[1]['key'] for c in self.s3.download_into.call_args_list],
+                             ['tmp/object2', 'tmp/object3', 'tmp/object1'])
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'133322')
+
+        self.assertDeleted(['tmp/object1', 'tmp/object2', 'tmp/object3', 'tmp/redshift-unloader/session_id/manifest'])
+
+    def test_unload_header_from_manifest(self):
+        filename = os.path.join(self.temp_dir, 'output')
+        self.bodies = {'tmp/object1': gzip.compress(b'"1","a"\n')}
+        entries = [ManifestEntry(key='tmp/object1', content_length=len(self.bodies['tmp/object1']), record_count=1)]
+        self.s3.read_manifest.return_value = Manifest(entries=entries, columns=['column1', 'column2'])
+
+        self.unloader.unload('some_query', filename, manifest=True)
+
+        self.redshift.get_columns.assert_not_called()
+        with gzip.open(filename, 'rb') as f:
+            self.assertEqual(f.read(), f'"column1","column2"{os.linesep}"1","a"\n'.encode())
+
+        self.s3.read_manifest.return_value = Manifest(entries=entries, columns=[])
+        self.redshift.get_columns.return_value = ['column1', 'column2']
+        self.unloader.unload('some_query', filename, add_quotes=False, manifest=True)
+
+        self.redshift.get_columns.assert_called_once_with('some_query', False)
+
+    def test_unload_with_column_cache(self):
+        unloader = self.create_unloader(column_cache_size=1)
+        filename = os.path.join(self.temp_dir, 'output')
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n')}
+        self.redshift.get_columns.return_value = ['"column1"', '"column2"']
+
+        unloader.unload('SELECT * FROM some_table', filename)
+        unloader.unload('SELECT *\n  FROM some_table;', filename)
+        self.assertEqual(self.redshift.get_columns.call_count, 1)
+
+        unloader.unload('SELECT * FROM another_table', filename)
+        unloader.unload('SELECT * FROM some_table', filename)
+        self.assertEqual(self.redshift.get_columns.call_count, 3)
+
+        with gzip.open(filename, 'rb') as f:
+            self.assertEqual(f.read(), f'"column1","column2"{os.linesep}"1","a"\n'.encode())
+
+        with self.assertRaises(ValueError):
+            self.create_unloader(column_cache_size=-1)
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow is not installed")
+    def test_unload_parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        filename = os.path.join(self.temp_dir, 'result.parquet')
+        values = {f'{self.SESSION_PATH}object1': [1, 2], f'{self.SESSION_PATH}object2': [3]}
+
+        self.bodies = dict.fromkeys(values, b'')
+        self.s3.download.side_effect = lambda key, filename, size: pyarrow.parquet.write_table(
+            pyarrow.table({'column1': values[key]}), filename)
+
+        with mock.patch('tempfile.gettempdir', return_value=self.temp_dir):
+            self.unloader.unload_parquet('some_query', filename)
+            table = self.unloader.unload_arrow('some_query')
+
+        _, kwargs = self.redshift.unload.call_args
+        self.assertEqual(kwargs['file_format'], 'PARQUET')
+        self.assertNotIn('gzip', kwargs)
+
+        self.assertListEqual(pyarrow.parquet.read_table(filename).column('column1').to_pylist(), [1, 2, 3])
+        self.assertListEqual(table.column('column1').to_pylist(), [1, 2, 3])
+        self.assertListEqual(os.listdir(self.temp_dir), ['result.parquet'])
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow is not installed")
+    def test_unload_parquet_empty(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        unloader = self.create_unloader(cache=ResultCache(os.path.join(self.temp_dir, 'cache'), ttl=60))
+        filename = os.path.join(self.temp_dir, 'result.parquet')
+        self.redshift.describe.return_value = [Column(name='id', type_code=dataframe.INT8),
+                                               Column(name='name', type_code=1043)]
+
+        unloader.unload_parquet('some_query', filename)
+        table = unloader.unload_arrow('some_query')
+
+        expected = pyarrow.schema([('id', pyarrow.int64()), ('name', pyarrow.string())])
+        written = pyarrow.parquet.read_table(filename)
+        self.assertEqual(written.num_rows, 0)
+        self.assertTrue(written.schema.equals(expected))
+        self.assertEqual(table.num_rows, 0)
+        self.assertTrue(table.schema.equals(expected))
+        self.s3.download.assert_not_called()
+
+    def test_unload_fileobj(self):
+        unloader = self.create_unloader(part_size=3, max_in_flight=2)
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n'),
+                       f'{self.SESSION_PATH}object2': gzip.compress(b'"2","bb"\n')}
+        self.redshift.get_columns.return_value = ['"column1"', '"column2"']
+        fileobj = io.BytesIO()
+
+        unloader.unload_fileobj('some_query', fileobj)
+
+        self.assertTrue(all(end - start <= 3 for _, (_, start, end), _ in self.s3.read_range.mock_calls))
+        with gzip.GzipFile(fileobj=io.BytesIO(fileobj.getvalue()), mode='rb') as f:
+            self.assertEqual(f.read(), f'"column1","column2"{os.linesep}"1","a"\n"2","bb"\n'.encode())
+        self.assertDeleted(list(self.bodies))
+        self.s3.download_into.assert_not_called()
+
+    def test_unload_codec(self):
+        unloader = self.create_unloader(part_size=4)
+        filename = os.path.join(self.temp_dir, 'output')
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n'),
+                       f'{self.SESSION_PATH}object2': gzip.compress(b'"2","bb"\n')}
+        self.redshift.get_columns.return_value = ['"column1"', '"column2"']
+        expected = f'"column1","column2"{os.linesep}"1","a"\n"2","bb"\n'.encode()
+
+        unloader.unload('some_query', filename, codec='plain')
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), expected)
+
+        unloader.unload('some_query', filename, codec='gzip_single')
+        with open(filename, 'rb') as f:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self.assertEqual(decompressor.decompress(f.read()), expected)
+            self.assertEqual(decompressor.unused_data, b'')
+
+        self.s3.download_into.assert_not_called()
+
+        with self.assertRaises(ValueError):
+            unloader.unload('some_query', filename, codec='bzip2')
+        with self.assertRaises(ValueError):
+            unloader.unload('some_query', filename, codec='plain', resume=True)
+
+    @unittest.skipIf(importlib.util.find_spec('pandas') is None, "pandas is not installed")
+    def test_unload_dataframe(self):
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n"2",""\n'),
+                       f'{self.SESSION_PATH}object2': gzip.compress(b'"3","ccc"\n')}
+        self.redshift.describe.return_value = [Column(name='id', type_code=dataframe.INT4),
+                                               Column(name='name', type_code=1043)]
+
+        with mock.patch('concurrent.futures.ProcessPoolExecutor',
+                        wraps=concurrent.futures.ProcessPoolExecutor) as processes:
+            frame = self.unloader.unload_dataframe('some_query', max_workers=2)
+        self.assertNotEqual(processes.call_args[1]['mp_context'].get_start_method(), 'fork')
+
+        self.assertListEqual(frame['id'].tolist(), [1, 2, 3])
+        self.assertListEqual(frame['name'].fillna('NULL').tolist(), ['a', 'NULL', 'ccc'])
+        self.assertDeleted(list(self.bodies))
+
+        columns = self.unloader.unload_numpy('some_query', max_workers=1)
+        self.assertListEqual(list(columns), ['id', 'name'])
+        self.assertListEqual(columns['id'].tolist(), [1, 2, 3])
+
+        with self.assertRaises(ValueError):
+            self.unloader.unload_dataframe('some_query', max_workers=0)
+
+    @unittest.skipIf(importlib.util.find_spec('pandas') is None, "pandas is not installed")
+    def test_unload_dataframe_in_parts(self):
+        unloader = self.create_unloader(part_size=3, max_in_flight=2)
+        self.bodies = {f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n"2","bb"\n'),
+                       f'{self.SESSION_PATH}object2': gzip.compress(b'"3","ccc"\n')}
+        self.redshift.describe.return_value = [Column(name='id', type_code=dataframe.INT4),
+                                               Column(name='name', type_code=1043)]
+
+        frame = unloader.unload_dataframe('some_query', max_workers=1)
+
+        self.assertListEqual(frame['id'].tolist(), [1, 2, 3])
+        self.assertListEqual(frame['name'].tolist(), ['a', 'bb', 'ccc'])
+        self.assertTrue(all(end - start <= 3 for _, (_, start, end), _ in self.s3.read_range.mock_calls))
+        self.assertDeleted(list(self.bodies))
+
+    def test_unload_many(self):
+        unloader = self.create_unloader(pool_size=2)
+        jobs = [UnloadJob('query1', os.path.join(self.temp_dir, 'output1')),
+                UnloadJob('query2', os.path.join(self.temp_dir, 'output2'), delimiter='|'),
+                UnloadJob('query3', os.path.join(self.temp_dir, 'output3'), with_header=False)]
+        error = RuntimeError('query2 failed')
+
+        self.redshift.get_columns.return_value = ['"column1"']
+        self.redshift.unload.side_effect = lambda query, *args, **kwargs: self.__raise_if(query == 'query2', error)
+
+        results = unloader.unload_many(jobs)
+
+        self.assertListEqual([result.job for result in results], jobs)
+        self.assertListEqual([result.succeeded for result in results], [True, False, True])
+        self.assertIs(results[1].error, error)
+        self.assertEqual(self.redshift.unload.call_count, 3)
+        self.assertCountEqual([c[1]['delimiter'] for c in self.redshift.unload.call_args_list], [',', '|', ','])
+
+        with self.assertRaises(ValueError):
+            unloader.unload_many(jobs, max_jobs=0)
+
+    @staticmethod
+    def __raise_if(condition, error):
+        if condition:
+            raise error
+
+    def test_iter_rows(self):
+        self.bodies = {
+            f'{self.SESSION_PATH}object1': gzip.compress(b'"1","a"\n') + gzip.compress(b'"2",""\n'),
+            f'{self.SESSION_PATH}object2': gzip.compress(b'"3","c"\n')
+        }
+
+        actual = list(self.unloader.iter_rows('some_query'))
+        expected = [['1', 'a'], ['2', None], ['3', 'c']]
+
+        self.assertListEqual(actual, expected)
+        self.assertDeleted(list(self.bodies))
+
+    def test_iter_batches(self):
+        self.bodies = {
+            f'{self.SESSION_PATH}object1': gzip.compress(b'"1"\n"2"\n"3"\n'),
+            f'{self.SESSION_PATH}object2': gzip.compress(b'"4"\n"5"\n')
+        }
+
+        batches = self.unloader.iter_batches('some_query', batch_size=2)
+        self.assertListEqual(next(batches), [['1'], ['2']])
+        self.s3.delete.assert_not_called()
+
+        self.assertListEqual(list(batches), [[['3'], ['4']], [['5']]])
+        self.assertDeleted(list(self.bodies))
+
+        with self.assertRaises(ValueError):
+            next(self.unloader.iter_batches('some_query', batch_size=0))
+
+    def test_unload_split(self):
+        unloader = self.create_unloader(pool_size=2)
+        filename = os.path.join(self.temp_dir, 'output')
+        s3_path = 'tmp/redshift-unloader/session_id/'
+        self.bodies = {f'{s3_path}0000/0000_part_00': b'a', f'{s3_path}0000/0001_part_00': b'bb',
+                       f'{s3_path}0001/0000_part_00': b'ccc', f'{s3_path}0001/0001_part_00': b'dddd'}
+
+        self.redshift.get_range.return_value = (1, 10)
+
+        with mock.patch.object(unloader, '_RedshiftUnloader__generate_session_id', return_value='session_id'):
+            unloader.unload('some_query', filename, with_header=False, split_column='id', partitions=2)
+
+        self.redshift.get_range.assert_called_once_with('some_query', 'id')
+        self.assertCountEqual([c[0] for c in self.redshift.unload.call_args_list], [
+            ('SELECT * FROM (some_query) AS query WHERE id >= 1 AND id < 6', f's3://bucket/{s3_path}0000/'),
+            ('SELECT * FROM (some_query) AS query WHERE (id >= 6 AND id <= 10) OR id IS NULL',
+             f's3://bucket/{s3_path}0001/')
+        ])
+
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'abbcccdddd')
+        self.assertDeleted(list(self.bodies))
+
+        with self.assertRaises(ValueError):
+            unloader.unload('some_query', filename, partitions=2)
+        with self.assertRaises(ValueError):
+            unloader.unload('some_query', filename, split_column='id', partitions=0)
+
+    def test__generate_range_queries(self):
+        method = self.unloader._RedshiftUnloader__generate_range_queries
+
+        self.assertListEqual(method('q', 'id', 0, 2, 4), [
+            'SELECT * FROM (q) AS query WHERE id >= 0 AND id < 1',
+            'SELECT * FROM (q) AS query WHERE id >= 1 AND id < 2',
+            'SELECT * FROM (q) AS query WHERE (id >= 2 AND id <= 2) OR id IS NULL'
+        ])
+        self.assertListEqual(method('q', 'score', 0.0, 1.0, 2), [
+            'SELECT * FROM (q) AS query WHERE score >= 0.0 AND score < 0.5',
+            'SELECT * FROM (q) AS query WHERE (score >= 0.5 AND score <= 1.0) OR score IS NULL'
+        ])
+
+        with self.assertRaises(ValueError):
+            method('q', 'name', 'a', 'z', 2)
+
+    def test_unload_auto_file_size(self):
+        unloader = self.create_unloader(concurrency=8, auto_file_size=True)
+        self.bodies = {f'{self.SESSION_PATH}object1': b'object1'}
+        self.redshift.get_slice_count.return_value = 4
+        self.redshift.estimate_size.return_value = 4 * 1024 ** 3
+
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output'), with_header=False)
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output'), with_header=False)
 
-            self.unloader._RedshiftUnloader__s3.list.assert_called_once_with(s3_path)
-            mock_mkdir.assert_called_once_with(local_path, 0o700)
+        _, kwargs = self.redshift.unload.call_args
+        self.assertTrue(kwargs['parallel'])
+        self.assertEqual(kwargs['max_file_size'], '128 MB')
+        self.redshift.get_slice_count.assert_called_once_with()
+        self.redshift.estimate_size.assert_called_with('some_query')
 
-            self.assertEqual(self.unloader._RedshiftUnloader__s3.download.call_count, len(s3_keys))
+        self.redshift.estimate_size.return_value = 1024
+        unloader.unload('some_query', os.path.join(self.temp_dir, 'output'), with_header=False)
 
-            self.assertEqual(mock_open.call_count, len(s3_keys) + 1)
-            self.assertListEqual(mock_open.call_args_list,
-                                 [call(filename, 'wb')] + list(map(lambda x: call(x, 'rb'), local_files)))
-            self.assertEqual(mock_copyfileobj.call_count, len(s3_keys))
+        _, kwargs = self.redshift.unload.call_args
+        self.assertFalse(kwargs['parallel'])
+        self.assertNotIn('max_file_size', kwargs)
 
-            self.unloader._RedshiftUnloader__s3.delete.assert_called_once_with(s3_keys)
+    def test__generate_layout(self):
+        generate_layout = self.unloader._RedshiftUnloader__generate_layout
+        mb = 1024 * 1024
 
-            mock_rmtree.asset_called_once_with(local_path)
+        self.assertEqual(generate_layout(4, None, 8), (True, None))
+        self.assertEqual(generate_layout(4, 100 * mb, 8), (False, None))
+        self.assertEqual(generate_layout(4, 4096 * mb, 8), (True, '128 MB'))
+        self.assertEqual(generate_layout(64, 4096 * mb, 8), (True, '32 MB'))
+        self.assertEqual(generate_layout(2, 10 ** 8 * mb, 2), (True, '6200 MB'))
 
     @mock.patch('uuid.uuid4')
     def test__generate_session_id(self, mock_uuid4):
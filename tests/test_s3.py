@@ -1,12 +1,18 @@
 import boto3
+import io
+import threading
 import unittest
 import tempfile
 import os
+import time
+
+from unittest import mock
 
 from moto import mock_s3
 
-from redshift_unloader.s3 import S3
+from redshift_unloader.s3 import MIN_PART_SIZE, BatchDeleter, PartSource, S3, S3Object
 from redshift_unloader.credential import Credential
+from redshift_unloader.metrics import Metrics
 
 
 class TestS3(unittest.TestCase):
@@ -50,6 +56,12 @@ class TestS3(unittest.TestCase):
         self.assertListEqual(self.s3.list('path/to/some/'), ['path/to/some/object4'])
         self.assertListEqual(self.s3.list('not/exist/path'), [])
 
+    def test_list_objects(self):
+        objects = self.s3.list_objects('path/to/some/')
+
+        self.assertListEqual([(obj.key, obj.size) for obj in objects], [('path/to/some/object4', 7)])
+        self.assertTrue(objects[0].etag)
+
     def test_delete(self):
         self.s3.delete(['path/to/object2', 'path/to/some/object4'])
         self.assertListEqual(self.s3.list(''), ['path/object1', 'path/to/object3'])
@@ -59,3 +71,236 @@ class TestS3(unittest.TestCase):
         self.s3.download(key='path/to/object2', filename=temp_file)
         with open(temp_file, 'r') as f:
             self.assertEqual(f.read(), 'object2')
+
+    def test_download_in_parts(self):
+        body = ''.join(map(str, range(100))).encode()
+        self.mocked_bucket.Object('path/to/large').put(Body=body)
+
+        s3 = S3(self.credential, bucket=self.BUCKET, region=self.REGION, part_size=16, part_concurrency=4)
+        temp_file = os.path.join(tempfile.gettempdir(), next(tempfile._get_candidate_names()))
+        s3.download(key='path/to/large', filename=temp_file)
+        with open(temp_file, 'rb') as f:
+            self.assertEqual(f.read(), body)
+        os.remove(temp_file)
+
+    def test_download_empty(self):
+        self.mocked_bucket.Object('path/to/empty').put(Body=b'')
+        temp_file = os.path.join(tempfile.gettempdir(), next(tempfile._get_candidate_names()))
+
+        self.s3.download(key='path/to/empty', filename=temp_file)
+        self.assertEqual(os.path.getsize(temp_file), 0)
+        self.s3.download(key='path/to/empty', filename=temp_file, size=0)
+        self.assertEqual(os.path.getsize(temp_file), 0)
+
+        with open(temp_file, 'wb') as f:
+            f.write(b'header')
+            self.s3.download_into(key='path/to/empty', fd=f.fileno(), offset=6, size=0)
+        with open(temp_file, 'rb') as f:
+            self.assertEqual(f.read(), b'header')
+        os.remove(temp_file)
+
+    def test_read_manifest(self):
+        body = '{"entries": [{"url": "s3://test_bucket/path/to/0000_part_00.gz", "meta": {"content_length": 10, "record_count": 2}}]}'
+        self.mocked_bucket.Object('path/to/manifest').put(Body=body.encode())
+
+        manifest = self.s3.read_manifest('path/to/manifest')
+
+        self.assertListEqual([entry.key for entry in manifest.entries], ['path/to/0000_part_00.gz'])
+        self.assertEqual(manifest.content_length, 10)
+
+    def test_download_into(self):
+        temp_file = os.path.join(tempfile.gettempdir(), next(tempfile._get_candidate_names()))
+        with open(temp_file, 'wb') as f:
+            f.write(b'header')
+            f.truncate(13)
+            self.s3.download_into(key='path/to/object2', fd=f.fileno(), offset=6, size=7)
+
+            with self.assertRaises(IOError):
+                self.s3.download_into(key='path/to/object3', fd=f.fileno(), offset=6, size=8)
+
+        with open(temp_file, 'rb') as f:
+            self.assertEqual(f.read(), b'headerobject2')
+        os.remove(temp_file)
+
+    def test_retries(self):
+        self.assertEqual(S3(self.credential, bucket=self.BUCKET, region='us-west-2').retries, 0)
+
+        self.s3.list('path/to/')
+        retries = self.s3.retries
+
+        self.s3._S3__client.meta.events.emit('after-call.s3.GetObject', http_response=None, context={},
+                                             parsed={'ResponseMetadata': {'RetryAttempts': 2}})
+        self.assertEqual(self.s3.retries, retries + 2)
+
+        records = []
+        with Metrics(records.append).measure('session_id', 'download'):
+            self.s3._S3__client.meta.events.emit('after-call.s3.GetObject', http_response=None, context={},
+                                                 parsed={'ResponseMetadata': {'RetryAttempts': 3}})
+        self.assertEqual(records[0].retries, 3)
+
+    def test_throttle(self):
+        s3 = S3(self.credential, bucket=self.BUCKET, region=self.REGION, max_pool_connections=8)
+        self.assertEqual(s3.list('path/to/some/'), ['path/to/some/object4'])
+        shared = s3._S3__shared
+
+        shared._SharedClient__check_throttle(response=(mock.Mock(status_code=503), {'Error': {'Code': 'SlowDown'}}))
+        self.assertEqual(shared.throttle.limit, 4)
+
+        for _ in range(8):
+            shared._SharedClient__check_throttle(response=(mock.Mock(status_code=200), {}))
+        self.assertEqual(shared.throttle.limit, 5)
+
+    def test_throttle_downloads(self):
+        body = bytes(range(256)) * 4
+        s3 = S3(self.credential, bucket=self.BUCKET, region=self.REGION, max_pool_connections=6,
+                part_size=16, part_concurrency=6)
+        s3.list('path/to/')
+        shared = s3._S3__shared
+
+        lock = threading.Lock()
+        active = []
+        peaks = []
+
+        def get_object(Bucket, Key, Range):
+            with lock:
+                active.append(Range)
+                peaks.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(Range)
+            start, end = map(int, Range[len('bytes='):].split('-'))
+            return {'Body': io.BytesIO(body[start:end + 1])}
+
+        with mock.patch.object(shared.client, 'get_object', side_effect=get_object), tempfile.TemporaryFile() as f:
+            s3.download_into(key='path/to/large', fd=f.fileno(), offset=0, size=len(body))
+            self.assertEqual(max(peaks), 6)
+
+            shared._SharedClient__check_throttle(response=(mock.Mock(status_code=503), {'Error': {'Code': 'SlowDown'}}))
+            peaks.clear()
+            s3.download_into(key='path/to/large', fd=f.fileno(), offset=0, size=len(body))
+            self.assertEqual(max(peaks), 3)
+
+            f.seek(0)
+            self.assertEqual(f.read(), body)
+
+    def test_delete_errors(self):
+        s3 = S3(self.credential, bucket=self.BUCKET, region=self.REGION)
+        client = s3._S3__client
+        with mock.patch.object(client, 'delete_objects',
+                               return_value={'Errors': [{'Key': 'path/object1', 'Code': 'AccessDenied'}]}):
+            with self.assertRaisesRegex(IOError, 'path/object1 \\(AccessDenied\\)'):
+                s3.delete(['path/object1', 'path/to/object2'])
+
+    def test_delete_in_batches(self):
+        keys = [f'batch/{i:04d}' for i in range(5)]
+        for key in keys:
+            self.mocked_bucket.Object(key).put(Body=b'')
+
+        with mock.patch('redshift_unloader.s3.MAX_DELETE_OBJECTS', 2), \
+                mock.patch.object(self.s3._S3__client, 'delete_objects',
+                                  wraps=self.s3._S3__client.delete_objects) as delete_objects:
+            self.s3.delete(keys)
+
+        self.assertListEqual(sorted(len(c[1]['Delete']['Objects']) for c in delete_objects.call_args_list),
+                             [1, 2, 2])
+        self.assertListEqual(self.s3.list('batch/'), [])
+
+    def test_deleter(self):
+        started = threading.Event()
+        release = threading.Event()
+        delete = mock.Mock(side_effect=lambda keys: (started.set(), release.wait(5)))
+        keys = [f'key{i:04d}' for i in range(1500)]
+
+        with BatchDeleter(delete, concurrency=2) as deleter:
+            deleter.add(keys[:1])
+            self.assertTrue(started.wait(5))
+            deleter.add(keys[1:1200])
+            deleter.add(keys[1000:])
+            release.set()
+
+        self.assertEqual(deleter.count, 1500)
+        self.assertListEqual(delete.call_args_list,
+                             [mock.call(keys[:1]), mock.call(keys[1:1001]), mock.call(keys[1001:])])
+
+        delete = mock.Mock(side_effect=IOError('Failed'))
+        deleter = BatchDeleter(delete)
+        deleter.add(['key'])
+        with self.assertRaises(IOError):
+            deleter.close()
+        deleter.close()
+
+    def test_list_modified(self):
+        modified = self.s3.list_modified('path/to/some/')
+
+        self.assertListEqual([key for key, _ in modified], ['path/to/some/object4'])
+        self.assertAlmostEqual(modified[0][1], time.time(), delta=300)
+
+    def test_shared_client(self):
+        s3 = S3(self.credential, bucket='other_bucket', region=self.REGION, part_size=16)
+
+        self.assertIs(s3._S3__client, self.s3._S3__client)
+        self.assertIsNot(S3(self.credential, bucket=self.BUCKET, region=self.REGION,
+                            max_pool_connections=1)._S3__client, self.s3._S3__client)
+
+        client = self.s3._S3__client
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(self.s3._S3__client, client)
+        self.assertIs(self.s3._S3__client, client)
+
+    def test_read_range(self):
+        self.assertEqual(self.s3.read_range('path/to/object2', 1, 4), b'bje')
+
+        with self.assertRaises(IOError):
+            self.s3.read_range('path/to/object2', 4, 10)
+
+    def test_plan_parts(self):
+        mb = 1024 * 1024
+        objects = [S3Object(key='large1', size=7 * mb, etag=''), S3Object(key='small1', size=1 * mb, etag=''),
+                   S3Object(key='small2', size=2 * mb, etag=''), S3Object(key='large2', size=12 * mb, etag=''),
+                   S3Object(key='small3', size=1 * mb, etag='')]
+
+        self.assertListEqual(S3.plan_parts(objects), [
+            [PartSource(key='large1', start=0, end=7 * mb)],
+            [PartSource(key='small1', start=0, end=1 * mb), PartSource(key='small2', start=0, end=2 * mb),
+             PartSource(key='large2', start=0, end=2 * mb)],
+            [PartSource(key='large2', start=2 * mb, end=12 * mb)],
+            [PartSource(key='small3', start=0, end=1 * mb)]
+        ])
+
+        self.assertListEqual(S3.plan_parts(objects[:2], header_size=10), [
+            [PartSource(key='large1', start=0, end=7 * mb)],
+            [PartSource(key='small1', start=0, end=1 * mb)]
+        ])
+        self.assertListEqual(S3.plan_parts(objects[3:4], header_size=10), [
+            [PartSource(key='large2', start=0, end=5 * mb - 10)],
+            [PartSource(key='large2', start=5 * mb - 10, end=12 * mb)]
+        ])
+
+        self.assertListEqual(S3.plan_parts([], header_size=10), [[]])
+        self.assertListEqual(S3.plan_parts([]), [])
+
+        empty = S3Object(key='empty', size=0, etag='')
+        self.assertListEqual(S3.plan_parts([empty]), [])
+        self.assertListEqual(S3.plan_parts([empty], header_size=10), [[]])
+        self.assertListEqual(S3.plan_parts([objects[0], empty, objects[1], empty]), [
+            [PartSource(key='large1', start=0, end=7 * mb)],
+            [PartSource(key='small1', start=0, end=1 * mb)]
+        ])
+
+    def test_concatenate(self):
+        bodies = [b'a' * (MIN_PART_SIZE + 1), b'b' * 10, b'c' * MIN_PART_SIZE, b'd' * 5]
+        objects = []
+        for i, body in enumerate(bodies):
+            self.mocked_bucket.Object(f'slices/{i}').put(Body=body)
+            objects.append(S3Object(key=f'slices/{i}', size=len(body), etag=''))
+
+        self.s3.concatenate(objects, 'result', header=b'header', concurrency=2)
+
+        self.assertEqual(self.mocked_bucket.Object('result').get()['Body'].read(), b'header' + b''.join(bodies))
+
+        self.s3.concatenate([], 'empty')
+        self.assertEqual(self.mocked_bucket.Object('empty').get()['Body'].read(), b'')
+
+        self.mocked_bucket.Object('slices/empty').put(Body=b'')
+        self.s3.concatenate([S3Object(key='slices/empty', size=0, etag='')], 'empty')
+        self.assertEqual(self.mocked_bucket.Object('empty').get()['Body'].read(), b'')
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from redshift_unloader.s3 import S3Object
+from redshift_unloader.session import SessionState
+
+
+class TestSessionState(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'output.session')
+        self.objects = [S3Object(key='path/to/object1', size=10, etag='"etag1"'),
+                        S3Object(key='path/to/object2', size=20, etag='')]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_and_load(self):
+        state = SessionState(path=self.path, session_id='session_id', fingerprint='fingerprint',
+                             s3_paths=['/path/to/'], objects=self.objects, columns=['column1'])
+        state.save()
+        state.complete(self.objects[0])
+
+        loaded = SessionState.load(self.path)
+
+        self.assertEqual(loaded.session_id, 'session_id')
+        self.assertEqual(loaded.fingerprint, 'fingerprint')
+        self.assertListEqual(loaded.s3_paths, ['/path/to/'])
+        self.assertListEqual(loaded.objects, self.objects)
+        self.assertListEqual(loaded.columns, ['column1'])
+        self.assertTrue(loaded.is_completed(self.objects[0]))
+        self.assertFalse(loaded.is_completed(self.objects[1]))
+
+        loaded.reset()
+        self.assertFalse(SessionState.load(self.path).is_completed(self.objects[0]))
+
+    def test_is_completed(self):
+        state = SessionState(path=self.path, session_id='session_id', fingerprint='fingerprint',
+                             s3_paths=['/path/to/'], objects=self.objects)
+        state.complete(self.objects[0])
+        state.complete(self.objects[1])
+
+        self.assertFalse(state.is_completed(self.objects[0]._replace(etag='"changed"')))
+        self.assertTrue(state.is_completed(self.objects[1]._replace(etag='"etag2"')))
+
+    def test_load_missing_or_broken(self):
+        self.assertIsNone(SessionState.load(self.path))
+
+        with open(self.path, 'w') as f:
+            f.write('{broken')
+        self.assertIsNone(SessionState.load(self.path))
+
+    def test_remove(self):
+        state = SessionState(path=self.path, session_id='session_id', fingerprint='fingerprint',
+                             s3_paths=['/path/to/'], objects=self.objects)
+        state.save()
+        state.remove()
+        state.remove()
+
+        self.assertFalse(os.path.exists(self.path))
@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from unittest import mock
+
+from redshift_unloader.throttle import Throttle
+
+
+class TestThrottle(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_decrease_and_increase(self):
+        throttle = Throttle(8, cooldown=0)
+
+        throttle.throttled()
+        self.assertEqual(throttle.limit, 4)
+        throttle.throttled()
+        throttle.throttled()
+        throttle.throttled()
+        self.assertEqual(throttle.limit, 1)
+
+        for _ in range(3):
+            throttle.succeeded()
+        self.assertEqual(throttle.limit, 2)
+        for _ in range(100):
+            throttle.succeeded()
+        self.assertEqual(throttle.limit, 8)
+
+    def test_cooldown(self):
+        with mock.patch('time.monotonic', side_effect=[10.0, 10.5, 11.0]):
+            throttle = Throttle(8, cooldown=1.0)
+            throttle.throttled()
+            throttle.throttled()
+            self.assertEqual(throttle.limit, 4)
+            throttle.throttled()
+            self.assertEqual(throttle.limit, 2)
+
+    def test_slot_is_bounded(self):
+        throttle = Throttle(2, cooldown=0)
+        throttle.throttled()
+        entered = []
+
+        def worker():
+            with throttle.slot():
+                entered.append(True)
+
+        with throttle.slot():
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+
+        thread.join()
+        self.assertListEqual(entered, [True])
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            Throttle(1, minimum=0)
+        with self.assertRaises(ValueError):
+            Throttle(1, minimum=2)
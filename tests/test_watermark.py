@@ -0,0 +1,62 @@
+import datetime
+import decimal
+import os
+import shutil
+import tempfile
+import unittest
+
+from redshift_unloader.watermark import FileWatermarkStore, Watermark, WatermarkStore, decode, encode, literal
+
+
+class TestWatermark(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'watermarks.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_literal(self):
+        self.assertEqual(literal(10), '10')
+        self.assertEqual(literal(decimal.Decimal('1.50')), '1.50')
+        self.assertEqual(literal(datetime.date(2018, 1, 2)), "'2018-01-02'")
+        self.assertEqual(literal(datetime.datetime(2018, 1, 2, 3, 4, 5)), "'2018-01-02 03:04:05'")
+        self.assertEqual(literal("it's"), "'it''s'")
+
+        with self.assertRaises(ValueError):
+            literal(True)
+        with self.assertRaises(ValueError):
+            literal(None)
+
+    def test_encode_and_decode(self):
+        values = [10, 1.5, decimal.Decimal('1.50'), 'abc', datetime.date(2018, 1, 2),
+                  datetime.datetime(2018, 1, 2, 3, 4, 5, 6),
+                  datetime.datetime(2018, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)]
+
+        for value in values:
+            self.assertEqual(decode(encode(value)), value)
+            self.assertIs(type(decode(encode(value))), type(value))
+
+    def test_file_watermark_store(self):
+        store = FileWatermarkStore(self.path)
+        self.assertIsNone(store.load('events'))
+
+        store.save('events', Watermark(value=datetime.datetime(2018, 1, 2), run=1))
+        store.save('users', Watermark(value=100, run=3))
+        store.save('events', Watermark(value=datetime.datetime(2018, 1, 3), run=2))
+
+        store = FileWatermarkStore(self.path)
+        self.assertEqual(store.load('events'), Watermark(value=datetime.datetime(2018, 1, 3), run=2))
+        self.assertEqual(store.load('users'), Watermark(value=100, run=3))
+
+    def test_partial_watermark_store(self):
+        class LoadOnlyStore(WatermarkStore):
+            def load(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            LoadOnlyStore()
+
+
+if __name__ == '__main__':
+    unittest.main()